@@ -3,11 +3,16 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Header
 import os
+import asyncio
 import secrets
-import requests
+import copy
+import httpx
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
 from dotenv import load_dotenv
+from http_client import CircuitBreaker, CircuitOpenError, request_with_retries
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -18,11 +23,177 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
+SESSION_CACHE_MAX_SIZE = int(os.getenv("SESSION_CACHE_MAX_SIZE", "10000"))
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "4"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))
+
+# Shared secret for the internal metrics endpoint; unset disables the endpoint
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+EMERGENT_AUTH_URL = os.getenv(
+    "EMERGENT_AUTH_URL",
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', '')
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME')]
 
+class SessionCache:
+    """Bounded LRU/TTL cache of resolved users keyed by session token"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # session_token -> {"user_id", "expires_at"}
+        self._sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+        # user_id -> user document, so user writes invalidate every session at once
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped by every invalidation; a lookup that started before one must not be cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, session_token: str):
+        """Return a copy of the cached user for a token, or None on a miss"""
+        session = self._sessions.get(session_token)
+        if session and session["expires_at"] <= datetime.utcnow():
+            self._sessions.pop(session_token, None)
+            session = None
+
+        user = self._users.get(session["user_id"]) if session else None
+        if user is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return copy.deepcopy(user)
+
+    def generation(self) -> int:
+        """Read before fetching from the database, then passed to set()"""
+        return self._generation
+
+    def set(self, session_token: str, session: dict, user: dict, generation: int):
+        """Cache a resolved session and its user, unless an invalidation ran since generation was read"""
+        if generation != self._generation:
+            self.stale_sets += 1
+            return
+        self._sessions[session_token] = {
+            "user_id": session["user_id"],
+            "expires_at": session["expires_at"]
+        }
+        self._users[session["user_id"]] = copy.deepcopy(user)
+
+    def invalidate_session(self, session_token: str):
+        """Drop a single session (logout)"""
+        self._generation += 1
+        if self._sessions.pop(session_token, None) is not None:
+            self.invalidations += 1
+
+    def invalidate_user(self, user_id: str):
+        """Drop the cached user so every session re-reads it from the database"""
+        self._generation += 1
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "stale_sets": self.stale_sets,
+            "sessions": len(self._sessions),
+            "users": len(self._users),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl
+        }
+
+session_cache = SessionCache(SESSION_CACHE_MAX_SIZE, SESSION_CACHE_TTL_SECONDS)
+
+# Event bus channel carrying session cache invalidations to every worker
+SESSION_CACHE_CHANNEL = "session_cache"
+
+async def _publish_session_invalidation(message: dict):
+    # realtime imports this module, so the bus is resolved at call time
+    from realtime import event_bus
+    await event_bus.publish(SESSION_CACHE_CHANNEL, message)
+
+def apply_session_invalidation(message: dict):
+    """Apply an invalidation published by any worker (this one included)"""
+    if "session_token" in message:
+        session_cache.invalidate_session(message["session_token"])
+    if "user_id" in message:
+        session_cache.invalidate_user(message["user_id"])
+
+async def invalidate_user(user_id: str):
+    """Invalidate cached copies of a user on every worker after writing to their document"""
+    await _publish_session_invalidation({"user_id": user_id})
+
+class PasswordHashPool:
+    """Runs bcrypt off the event loop on a dedicated, size-limited thread pool"""
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        # Calls queued or running on the pool, including ones whose caller has gone away
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        """Run func on the pool, rejecting with 429 once max_pending calls are queued"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many authentication requests, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(func, *args)
+        self.pending += 1
+        # Counted down when the thread finishes, not when the caller stops waiting:
+        # a cancelled request cannot stop bcrypt once it is running
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._finished, f))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future):
+        self.pending -= 1
+        if future.cancelled():
+            return  # Dropped from the queue before it started
+        if future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def stats(self) -> dict:
+        """Queue depth and throughput counters for monitoring"""
+        return {
+            "in_flight": self.pending,
+            "queue_depth": max(self.pending - self.max_workers, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+password_hash_pool = PasswordHashPool(BCRYPT_MAX_WORKERS, BCRYPT_MAX_PENDING)
+
 def hash_password(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
@@ -31,24 +202,46 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    return await password_hash_pool.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against a hash without blocking the event loop"""
+    return await password_hash_pool.run(verify_password, plain_password, hashed_password)
+
 def create_session_token() -> str:
     """Create a unique session token"""
     return secrets.token_urlsafe(32)
 
+emergent_auth_breaker = CircuitBreaker("emergent_auth")
+
 async def get_user_from_emergent_session(session_id: str) -> dict:
     """Get user data from Emergent Auth API"""
     try:
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id},
-            timeout=10
+        response = await request_with_retries(
+            "GET",
+            EMERGENT_AUTH_URL,
+            emergent_auth_breaker,
+            headers={"X-Session-ID": session_id}
         )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(status_code=401, detail="Invalid session ID")
-    except Exception as e:
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Auth service temporarily unavailable")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Auth service error: {str(e)}")
+    
+    # Still failing after retries: an outage, not bad credentials
+    if response.status_code == 503:
+        raise HTTPException(status_code=503, detail="Auth service temporarily unavailable")
+    if response.status_code >= 500:
+        raise HTTPException(status_code=502, detail="Auth service error")
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid session ID")
+    
+    try:
+        return response.json()
+    except ValueError as e:
         raise HTTPException(status_code=500, detail=f"Auth service error: {str(e)}")
 
 async def create_user_session(user_id: str) -> str:
@@ -66,63 +259,92 @@ async def create_user_session(user_id: str) -> str:
     await db.user_sessions.insert_one(session)
     return session_token
 
-async def get_current_user(authorization: str = Header(None)):
-    """Get current user from session token"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="No authorization token")
+async def _fetch_session_user(session_token: str):
+    """Fetch a live session and its user in a single aggregation round trip"""
+    pipeline = [
+        {"$match": {
+            "session_token": session_token,
+            "expires_at": {"$gt": datetime.utcnow()}
+        }},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "as": "user"
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": 1,
+            "expires_at": 1,
+            "user": {"$arrayElemAt": ["$user", 0]}
+        }},
+        {"$project": {"user._id": 0, "user.password_hash": 0}}
+    ]
     
-    session_token = authorization.replace("Bearer ", "")
+    results = await db.user_sessions.aggregate(pipeline).to_list(1)
+    return results[0] if results else None
+
+async def resolve_session_user(session_token: str, required: bool = True):
+    """Resolve a session token to its user, via the session cache when possible.
     
-    # Find session
-    session = await db.user_sessions.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
+    Raises 401/404 when required, otherwise returns None for an unknown
+    session or a missing user.
+    """
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
+    
+    # An invalidation during the fetch means the result may already be stale
+    generation = session_cache.generation()
+    session = await _fetch_session_user(session_token)
     
     if not session:
-        raise HTTPException(status_code=401, detail="Invalid or expired session")
+        if required:
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+        return None
     
-    # Get user
-    user = await db.users.find_one({"id": session["user_id"]})
+    user = session.get("user")
     
     if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        if required:
+            raise HTTPException(status_code=404, detail="User not found")
+        return None
     
-    # Remove MongoDB _id for clean response
-    if "_id" in user:
-        del user["_id"]
+    session_cache.set(session_token, session, user, generation)
     
     return user
 
-async def get_current_user_optional(authorization: str = Header(None)):
-    """Get current user from session token (optional - returns None if not authenticated)"""
+async def get_current_user(authorization: str = Header(None)):
+    """Get current user from session token"""
     if not authorization or not authorization.startswith("Bearer "):
-        return None
+        raise HTTPException(status_code=401, detail="No authorization token")
     
     session_token = authorization.replace("Bearer ", "")
     
-    # Find session
-    session = await db.user_sessions.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
-    
-    if not session:
-        return None
-    
-    # Get user
-    user = await db.users.find_one({"id": session["user_id"]})
-    
-    if not user:
+    return await resolve_session_user(session_token)
+
+async def get_current_user_optional(authorization: str = Header(None)):
+    """Get current user from session token (optional - returns None if not authenticated)"""
+    if not authorization or not authorization.startswith("Bearer "):
         return None
     
-    # Remove MongoDB _id for clean response
-    if "_id" in user:
-        del user["_id"]
+    session_token = authorization.replace("Bearer ", "")
     
-    return user
+    return await resolve_session_user(session_token, required=False)
 
+async def require_metrics_token(x_metrics_token: str = Header(None)):
+    """Gate internal monitoring endpoints behind the METRICS_TOKEN shared secret"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_metrics_token or not secrets.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
 
 async def delete_session(session_token: str):
-    """Delete a session (logout)"""
+    """Delete a session (logout) and drop it from every worker's cache.
+
+    The database delete comes first: a request racing the logout then
+    misses the cache, finds no session and cannot re-cache the token.
+    """
     await db.user_sessions.delete_one({"session_token": session_token})
+    await _publish_session_invalidation({"session_token": session_token})
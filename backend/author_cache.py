@@ -0,0 +1,64 @@
+"""
+Author cache for XelaConnect feeds
+Resolves user ids to the name/picture shown next to content, batching misses into one $in query
+"""
+import os
+from typing import Dict, Iterable
+
+from cachetools import TTLCache
+
+from auth import db
+
+AUTHOR_CACHE_MAX_SIZE = int(os.getenv("AUTHOR_CACHE_MAX_SIZE", "10000"))
+# Short-lived: other workers only see name/picture changes once this expires
+AUTHOR_CACHE_TTL_SECONDS = int(os.getenv("AUTHOR_CACHE_TTL_SECONDS", "60"))
+AUTHOR_PROJECTION = {"_id": 0, "id": 1, "name": 1, "picture": 1}
+
+class AuthorCache:
+    """Bounded TTL cache of user id -> {"name", "picture"}"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._authors = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Authors for the given ids; unknown users are omitted"""
+        authors = {}
+        missing = []
+        for user_id in set(user_ids):
+            author = self._authors.get(user_id)
+            if author is None:
+                missing.append(user_id)
+            else:
+                authors[user_id] = author
+        self.hits += len(authors)
+        self.misses += len(missing)
+
+        if missing:
+            users = await db.users.find({"id": {"$in": missing}}, AUTHOR_PROJECTION).to_list(len(missing))
+            for u in users:
+                author = {"name": u.get("name"), "picture": u.get("picture")}
+                self._authors[u["id"]] = author
+                authors[u["id"]] = author
+
+        # Callers attach these to response items, so hand out copies
+        return {user_id: dict(author) for user_id, author in authors.items()}
+
+    def invalidate(self, user_id: str):
+        self._authors.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "authors": len(self._authors),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl
+        }
+
+author_cache = AuthorCache(AUTHOR_CACHE_MAX_SIZE, AUTHOR_CACHE_TTL_SECONDS)
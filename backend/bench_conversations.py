@@ -0,0 +1,100 @@
+"""
+Benchmark conversation listing: per-conversation user lookups vs one batched $in query
+Runs against a scratch database (<DB_NAME>_bench) that is dropped afterwards
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Point the app's own database handle at the scratch database before importing it
+os.environ["DB_NAME"] = f"{os.environ.get('DB_NAME')}_bench"
+from auth import client, db
+from messaging import get_user_summaries
+
+CONVERSATION_COUNTS = [10, 50, 100]
+ROUNDS = 20
+
+async def seed(count: int) -> str:
+    """Create one user with `count` conversations, each with a distinct counterpart"""
+    await db.users.delete_many({})
+    await db.conversations.delete_many({})
+
+    me = str(uuid.uuid4())
+    users = [{"id": me, "name": "Bench", "email": "bench@example.com", "interests": ["Yoga"] * 20}]
+    conversations = []
+    now = datetime.utcnow()
+    for i in range(count):
+        other_id = str(uuid.uuid4())
+        users.append({
+            "id": other_id,
+            "name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "picture": "https://example.com/avatar.png",
+            "bio": "x" * 500,
+            "courses_progress": [{"course_id": str(uuid.uuid4()), "progress": 50}] * 10
+        })
+        conversations.append({
+            "id": str(uuid.uuid4()),
+            "user_id": me,
+            "with_user_id": other_id,
+            "type": "user_to_user",
+            "last_message_at": now - timedelta(minutes=i)
+        })
+
+    await db.users.insert_many(users)
+    await db.conversations.insert_many(conversations)
+    await db.users.create_index("id", unique=True)
+    await db.conversations.create_index([("user_id", 1), ("type", 1), ("last_message_at", -1)])
+    return me
+
+async def list_conversations(me: str) -> list:
+    return await db.conversations.find(
+        {"$or": [{"user_id": me}, {"with_user_id": me}], "type": "user_to_user"},
+        {"_id": 0}
+    ).sort("last_message_at", -1).to_list(100)
+
+async def per_conversation_lookup(me: str):
+    """The previous behaviour: one users.find_one per conversation"""
+    conversations = await list_conversations(me)
+    for conv in conversations:
+        other_id = conv["with_user_id"] if conv["user_id"] == me else conv["user_id"]
+        conv["other_user"] = await db.users.find_one({"id": other_id}, {"_id": 0, "password_hash": 0})
+
+async def batched_lookup(me: str):
+    """The current behaviour: messaging.get_user_summaries, one $in query with a slim projection"""
+    conversations = await list_conversations(me)
+    other_ids = [c["with_user_id"] if c["user_id"] == me else c["user_id"] for c in conversations]
+    by_id = await get_user_summaries(other_ids)
+    for conv, other_id in zip(conversations, other_ids):
+        conv["other_user"] = by_id.get(other_id)
+
+async def time_ms(func, me: str) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await func(me)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+async def main():
+    print("⏱  Conversation listing latency (ms, mean of %d rounds)" % ROUNDS)
+    print(f"{'conversations':>14} {'per-conversation':>18} {'batched $in':>12} {'speedup':>8}")
+    for count in CONVERSATION_COUNTS:
+        me = await seed(count)
+        # Warm up connections and caches before timing
+        await per_conversation_lookup(me)
+        await batched_lookup(me)
+        n_plus_one = await time_ms(per_conversation_lookup, me)
+        batched = await time_ms(batched_lookup, me)
+        print(f"{count:>14} {n_plus_one:>18.2f} {batched:>12.2f} {n_plus_one / batched:>7.1f}x")
+
+    await client.drop_database(db.name)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
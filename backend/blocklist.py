@@ -0,0 +1,97 @@
+"""
+Block-list cache for XelaConnect
+Per-user blocked sets plus a reverse blocked_by index, so block checks never load user documents
+"""
+import os
+from typing import Dict, Set, Tuple
+
+from auth import db
+from realtime import event_bus, on_bus_event
+from reloadable import ReloadableMirror
+
+# Full reload interval, a backstop for block events missed by this worker
+BLOCKLIST_REFRESH_SECONDS = float(os.getenv("BLOCKLIST_REFRESH_SECONDS", "300"))
+
+class BlockList(ReloadableMirror):
+    """In-memory mirror of users.blocked_users in both directions"""
+
+    name = "Block list"
+
+    def __init__(self):
+        super().__init__(BLOCKLIST_REFRESH_SECONDS)
+        # user_id -> ids that user has blocked
+        self._blocked: Dict[str, Set[str]] = {}
+        # user_id -> ids of users who blocked them
+        self._blocked_by: Dict[str, Set[str]] = {}
+
+    async def _build(self) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+        """Both indexes, built from the users that have blocked anyone"""
+        blocked: Dict[str, Set[str]] = {}
+        blocked_by: Dict[str, Set[str]] = {}
+        cursor = db.users.find(
+            {"blocked_users.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "blocked_users": 1}
+        )
+        async for user in cursor:
+            blocked[user["id"]] = set(user["blocked_users"])
+            for blocked_id in user["blocked_users"]:
+                blocked_by.setdefault(blocked_id, set()).add(user["id"])
+        return blocked, blocked_by
+
+    def _replay(self, state, change: Tuple[str, str, bool]):
+        _apply_block(*state, *change)
+
+    def _swap(self, state):
+        self._blocked, self._blocked_by = state
+
+    def apply(self, user_id: str, blocked_id: str, is_blocked: bool):
+        """Apply a single block/unblock to both indexes"""
+        _apply_block(self._blocked, self._blocked_by, user_id, blocked_id, is_blocked)
+        self._record((user_id, blocked_id, is_blocked))
+
+    def blocked_ids(self, user_id: str) -> Set[str]:
+        """Users this user has blocked"""
+        return set(self._blocked.get(user_id, ()))
+
+    def is_blocked(self, user_id: str, other_id: str) -> bool:
+        """Has user_id blocked other_id?"""
+        return other_id in self._blocked.get(user_id, ())
+
+    def can_message(self, a: str, b: str) -> bool:
+        """Neither user has blocked the other"""
+        return b not in self._blocked.get(a, ()) and a not in self._blocked.get(b, ())
+
+    def hidden_from(self, user_id: str) -> Set[str]:
+        """Every user on either side of a block with this user"""
+        return self._blocked.get(user_id, set()) | self._blocked_by.get(user_id, set())
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "blockers": sum(1 for s in self._blocked.values() if s),
+            "blocks": sum(len(s) for s in self._blocked.values())
+        }
+
+def _apply_block(blocked: Dict[str, Set[str]], blocked_by: Dict[str, Set[str]],
+                 user_id: str, blocked_id: str, is_blocked: bool):
+    if is_blocked:
+        blocked.setdefault(user_id, set()).add(blocked_id)
+        blocked_by.setdefault(blocked_id, set()).add(user_id)
+        return
+
+    blocked.get(user_id, set()).discard(blocked_id)
+    blocked_by.get(blocked_id, set()).discard(user_id)
+
+block_list = BlockList()
+
+async def publish_block_change(user_id: str, blocked_id: str, is_blocked: bool):
+    """Tell every worker's block list about a block or unblock"""
+    await event_bus.publish("block", {
+        "user_id": user_id,
+        "blocked_id": blocked_id,
+        "is_blocked": is_blocked
+    })
+
+@on_bus_event("block")
+async def sync_block_list(message: dict):
+    block_list.apply(message["user_id"], message["blocked_id"], message["is_blocked"])
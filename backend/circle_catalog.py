@@ -0,0 +1,101 @@
+"""
+Circle catalog cache for XelaConnect
+Serializes the circle list once per category and serves it with an ETag,
+so repeat requests answer from memory or with 304 Not Modified
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+from cachetools import TTLCache
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from auth import db
+from realtime import event_bus, on_bus_event
+
+# Backstop for changes that bypass the API, e.g. the seed scripts
+CIRCLE_CATALOG_TTL_SECONDS = int(os.getenv("CIRCLE_CATALOG_TTL_SECONDS", "300"))
+# How long clients and CDNs may reuse a response before revalidating
+CIRCLE_CATALOG_MAX_AGE = int(os.getenv("CIRCLE_CATALOG_MAX_AGE", "60"))
+# The list view never needs member ids
+CIRCLE_LIST_PROJECTION = {"_id": 0, "members": 0}
+
+class CircleCatalog:
+    """Category -> pre-serialized circle list plus its ETag"""
+
+    def __init__(self, ttl: int = CIRCLE_CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = TTLCache(maxsize=64, ttl=ttl)
+        # Bumped by invalidate(); a build that started before an invalidation is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    async def _build(self, category: Optional[str]) -> dict:
+        query = {"category": category} if category else {}
+        circles = await db.circles.find(query, CIRCLE_LIST_PROJECTION).to_list(1000)
+        body = json.dumps(jsonable_encoder({"circles": circles}), separators=(",", ":")).encode()
+        return {"body": body, "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
+
+    async def get(self, category: Optional[str]) -> dict:
+        key = category or "All"
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            generation = self._generation
+            entry = await self._build(category)
+            if generation == self._generation:
+                self._entries[key] = entry
+        else:
+            self.hits += 1
+        return entry
+
+    async def respond(self, request: Request, category: Optional[str]) -> Response:
+        """200 with the cached body, or 304 when the client already holds it"""
+        entry = await self.get(category)
+        headers = {
+            "ETag": entry["etag"],
+            "Cache-Control": f"public, max-age={CIRCLE_CATALOG_MAX_AGE}"
+        }
+        # If-None-Match uses the weak comparison (RFC 9110 13.1.2): W/"x" matches "x"
+        if_none_match = request.headers.get("if-none-match", "")
+        tags = [_opaque_tag(tag) for tag in if_none_match.split(",")]
+        if _opaque_tag(entry["etag"]) in tags or if_none_match.strip() == "*":
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    def invalidate(self):
+        self._generation += 1
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "categories": len(self._entries),
+            "ttl_seconds": self.ttl
+        }
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+circle_catalog = CircleCatalog()
+
+async def publish_circles_changed():
+    """Tell every worker to drop its catalog after a membership change"""
+    await event_bus.publish("circles", {})
+
+@on_bus_event("circles")
+async def sync_circle_catalog(message: dict):
+    circle_catalog.invalidate()
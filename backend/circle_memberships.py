@@ -0,0 +1,56 @@
+"""
+Circle membership storage for XelaConnect
+One circle_memberships document per (circle, user) instead of an ever-growing circles.members array
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+from auth import db
+from pagination import SortKey, keyset_page
+
+def new_membership(circle_id: str, user_id: str, **extra) -> dict:
+    """Build a membership document"""
+    return {
+        "circle_id": circle_id,
+        "user_id": user_id,
+        "joined_at": datetime.utcnow(),
+        **extra
+    }
+
+async def add_member(circle_id: str, user_id: str) -> bool:
+    """Record a membership; returns True only if the user was not already a member"""
+    result = await db.circle_memberships.update_one(
+        {"circle_id": circle_id, "user_id": user_id},
+        {"$setOnInsert": new_membership(circle_id, user_id)},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+async def remove_member(circle_id: str, user_id: str) -> bool:
+    """Delete a membership; returns True only if there was one"""
+    result = await db.circle_memberships.delete_one({"circle_id": circle_id, "user_id": user_id})
+    return result.deleted_count > 0
+
+async def is_member(circle_id: str, user_id: str) -> bool:
+    """Point lookup on the circle_id_user_id_unique index"""
+    membership = await db.circle_memberships.find_one(
+        {"circle_id": circle_id, "user_id": user_id},
+        {"_id": 0, "circle_id": 1}
+    )
+    return membership is not None
+
+async def get_members_page(
+    circle_id: str,
+    before: Optional[SortKey] = None,
+    limit: int = 50
+) -> Tuple[list, Optional[str]]:
+    """Return (memberships newest first, next cursor), starting after the `before` sort key"""
+    # circle_id_joined_at_user_id index
+    return await keyset_page(
+        db.circle_memberships,
+        {"circle_id": circle_id},
+        {"_id": 0, "user_id": 1, "joined_at": 1},
+        before,
+        limit,
+        "joined_at",
+        id_field="user_id"
+    )
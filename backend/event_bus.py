@@ -0,0 +1,222 @@
+"""
+Pluggable event bus for XelaConnect real-time events
+Fans events out to every API worker so each can deliver to the sockets it holds
+
+Backends (EVENT_BUS_BACKEND):
+- memory: single process, events are delivered in-process
+- mongo:  multi-worker, events go through a capped collection that every
+          worker tails; runs against any MongoDB, including a local mongod
+"""
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Set
+
+from pymongo import ASCENDING, DESCENDING, CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "memory")
+EVENT_BUS_COLLECTION = os.getenv("EVENT_BUS_COLLECTION", "realtime_events")
+EVENT_BUS_CAPPED_BYTES = int(os.getenv("EVENT_BUS_CAPPED_BYTES", str(64 * 1024 * 1024)))
+EVENT_BUS_RETRY_SECONDS = float(os.getenv("EVENT_BUS_RETRY_SECONDS", "1"))
+# Holds one counter document per bus collection, the source of event sequence numbers
+EVENT_BUS_SEQUENCE_COLLECTION = os.getenv("EVENT_BUS_SEQUENCE_COLLECTION", "event_bus_sequences")
+# Sequence numbers re-read when a tail reopens its cursor, and how many delivered ones are remembered
+EVENT_BUS_RESUME_OVERLAP = 64
+EVENT_BUS_RECENT_SEQS = 1024
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+class EventBus(ABC):
+    """Base bus: publish(channel, message) reaches the handler on every worker"""
+
+    backend = "base"
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self.published = defaultdict(int)
+        self.delivered = defaultdict(int)
+        self.failed = defaultdict(int)
+
+    def subscribe(self, handler: Handler):
+        """Set the local consumer, called with (channel, message)"""
+        self._handler = handler
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        """Deliver to the local handler and fan out to every other worker"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def _deliver(self, channel: str, message: dict):
+        if self._handler is None:
+            return
+        try:
+            await self._handler(channel, message)
+            self.delivered[channel] += 1
+        except Exception as e:
+            self.failed[channel] += 1
+            logger.error(f"Event bus delivery on '{channel}' failed: {str(e)}")
+
+    def stats(self) -> dict:
+        channels = set(self.published) | set(self.delivered) | set(self.failed)
+        return {
+            "backend": self.backend,
+            "channels": {
+                channel: {
+                    "published": self.published[channel],
+                    "delivered": self.delivered[channel],
+                    "failed": self.failed[channel]
+                }
+                for channel in sorted(channels)
+            }
+        }
+
+class InMemoryEventBus(EventBus):
+    """Single-process bus: publishing delivers straight to the local handler"""
+
+    backend = "memory"
+
+    async def publish(self, channel: str, message: dict):
+        self.published[channel] += 1
+        await self._deliver(channel, message)
+
+class MongoEventBus(EventBus):
+    """Multi-worker bus backed by a tailable cursor on a capped collection.
+
+    Events are delivered to the local handler immediately and written to the
+    collection; every other worker picks them up from its tail. Each event
+    carries a sequence number from a counter document, so a tail that has to
+    reopen its cursor filters on the server (seq > last seen) rather than
+    re-reading the collection, and never depends on worker clocks.
+    Delivery is at-most-once: events published while a worker's tail is
+    reconnecting are only seen if they are still in the capped collection
+    when it resumes.
+    """
+
+    backend = "mongo"
+
+    def __init__(self, db, collection_name: str = EVENT_BUS_COLLECTION):
+        super().__init__()
+        self._db = db
+        self._collection_name = collection_name
+        self._collection = db[collection_name]
+        self._sequences = db[EVENT_BUS_SEQUENCE_COLLECTION]
+        self._origin = str(uuid.uuid4())
+        self._task: Optional[asyncio.Task] = None
+        # Highest sequence number seen, and the one at start (events before it are never delivered)
+        self._last_seq = 0
+        self._start_seq = 0
+        # Recently delivered sequence numbers, so the resume overlap is not delivered twice
+        self._recent = deque(maxlen=EVENT_BUS_RECENT_SEQS)
+        self._recent_set: Set[int] = set()
+        self.reopens = 0
+
+    async def start(self):
+        try:
+            await self._db.create_collection(
+                self._collection_name,
+                capped=True,
+                size=EVENT_BUS_CAPPED_BYTES
+            )
+        except CollectionInvalid:
+            pass  # Already exists
+        await self._collection.create_index([("seq", ASCENDING)], name="seq")
+        newest = await self._collection.find_one({}, {"_id": 0, "seq": 1}, sort=[("seq", DESCENDING)])
+        self._start_seq = self._last_seq = (newest or {}).get("seq", 0)
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _next_seq(self) -> int:
+        counter = await self._sequences.find_one_and_update(
+            {"_id": self._collection_name},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
+    async def publish(self, channel: str, message: dict):
+        self.published[channel] += 1
+        await self._deliver(channel, message)
+        await self._collection.insert_one({
+            "seq": await self._next_seq(),
+            "channel": channel,
+            "message": message,
+            "origin": self._origin,
+            "created_at": datetime.utcnow()
+        })
+
+    def _remember(self, seq: int) -> bool:
+        """Record a delivered sequence number; False if it was already delivered"""
+        if seq in self._recent_set:
+            return False
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(seq)
+        self._recent_set.add(seq)
+        return True
+
+    async def _tail(self):
+        """Follow the capped collection, delivering events from other workers.
+
+        One cursor is kept open while it is alive; an empty await just loops
+        back into the server-side wait. Publishers take their sequence number
+        before inserting, so a slightly lower number can land after a higher
+        one: a reopened cursor re-reads EVENT_BUS_RESUME_OVERLAP numbers and
+        skips the ones already delivered.
+        """
+        while True:
+            cursor = None
+            try:
+                since = max(self._last_seq - EVENT_BUS_RESUME_OVERLAP, self._start_seq)
+                cursor = self._collection.find(
+                    {"seq": {"$gt": since}},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for event in cursor:
+                        if not self._remember(event["seq"]):
+                            continue
+                        self._last_seq = max(self._last_seq, event["seq"])
+                        if event.get("origin") != self._origin:
+                            await self._deliver(event["channel"], event["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event bus tail interrupted: {str(e)}")
+            finally:
+                if cursor is not None:
+                    await cursor.close()
+            # The cursor only dies when the collection is empty or on errors; reopen after a pause
+            self.reopens += 1
+            await asyncio.sleep(EVENT_BUS_RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "last_seq": self._last_seq, "reopens": self.reopens}
+
+def create_event_bus(db) -> EventBus:
+    """Build the bus selected by EVENT_BUS_BACKEND"""
+    if EVENT_BUS_BACKEND == "mongo":
+        return MongoEventBus(db)
+    if EVENT_BUS_BACKEND != "memory":
+        logger.warning(f"Unknown EVENT_BUS_BACKEND '{EVENT_BUS_BACKEND}', using memory")
+    return InMemoryEventBus()
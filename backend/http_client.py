@@ -0,0 +1,149 @@
+"""
+Shared outbound HTTP client for XelaConnect
+Process-wide connection pool with timeouts, jittered retries and circuit breakers
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "3"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.2"))
+
+RETRY_STATUS_CODES = {502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited by an open breaker"""
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through after a cooldown"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.short_circuited = 0
+
+    def allow_request(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.short_circuited += 1
+                return False
+            self.state = "half_open"
+            return True
+
+        if self.state == "half_open":
+            # A probe is already in flight
+            self.short_circuited += 1
+            return False
+
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def release_probe(self):
+        """A half-open probe ended without an outcome (e.g. cancelled); let the next call probe"""
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit breaker '{self.name}' opened")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "short_circuited": self.short_circuited
+        }
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+    return _client
+
+async def close_http_client():
+    """Close the pooled client (on shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def request_with_retries(
+    method: str,
+    url: str,
+    breaker: CircuitBreaker,
+    max_retries: int = HTTP_MAX_RETRIES,
+    **kwargs
+) -> httpx.Response:
+    """Send a request through the breaker, retrying transport errors and 502/503/504.
+
+    Retries back off exponentially with full jitter. Any other response,
+    including 4xx, counts as the upstream being healthy.
+    """
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"{breaker.name} circuit is open")
+
+    client = get_http_client()
+    attempt = 0
+    settled = False
+    try:
+        while True:
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    settled = True
+                    breaker.record_success()
+                    return response
+                error = None
+            except httpx.TransportError as e:
+                response = None
+                error = e
+            except Exception:
+                settled = True
+                breaker.record_failure()
+                raise
+
+            if attempt >= max_retries:
+                settled = True
+                breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt)))
+    finally:
+        # Cancellation is a BaseException: without this a cancelled probe leaves the breaker half-open forever
+        if not settled:
+            breaker.release_probe()
@@ -0,0 +1,175 @@
+"""
+MongoDB index declarations for XelaConnect
+Ensured on API startup, or run standalone: python indexes.py
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+logger = logging.getLogger(__name__)
+
+# collection -> list of index specs (keys plus create_index options)
+INDEXES = {
+    "users": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+        {"keys": [("last_active", DESCENDING), ("id", DESCENDING)], "name": "last_active_id"},
+    ],
+    "user_sessions": [
+        {"keys": [("session_token", ASCENDING)], "name": "session_token_unique", "unique": True},
+        {"keys": [("user_id", ASCENDING)], "name": "user_id"},
+        # Mongo deletes each session once its expires_at has passed
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "conversations": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+        {
+            "keys": [("user_id", ASCENDING), ("type", ASCENDING), ("last_message_at", DESCENDING)],
+            "name": "user_id_type_last_message_at"
+        },
+        {
+            "keys": [("with_user_id", ASCENDING), ("type", ASCENDING), ("last_message_at", DESCENDING)],
+            "name": "with_user_id_type_last_message_at"
+        },
+    ],
+    "messages": [
+        {
+            "keys": [("conversation_id", ASCENDING), ("last_at", DESCENDING)],
+            "name": "conversation_id_last_at"
+        },
+        {
+            "keys": [("conversation_id", ASCENDING), ("first_at", ASCENDING)],
+            "name": "conversation_id_first_at"
+        },
+        # At most one open bucket per conversation; appends only ever target it
+        {
+            "keys": [("conversation_id", ASCENDING)],
+            "name": "conversation_id_open_unique",
+            "unique": True,
+            "partialFilterExpression": {"open": True}
+        },
+    ],
+    "reflections": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+        {
+            "keys": [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            "name": "user_id_created_at_id"
+        },
+        {
+            "keys": [("is_public", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            "name": "is_public_created_at_id"
+        },
+        # Only one text index is allowed per collection; it backs /reflections/search
+        {
+            "keys": [("prompt", TEXT), ("content", TEXT)],
+            "name": "prompt_content_text",
+            "weights": {"prompt": 2, "content": 1}
+        },
+    ],
+    "activities": [
+        {"keys": [("user_id", ASCENDING), ("created_at", DESCENDING)], "name": "user_id_created_at"},
+        {"keys": [("id", ASCENDING), ("user_id", ASCENDING)], "name": "id_user_id"},
+    ],
+    "circles": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+        {"keys": [("category", ASCENDING)], "name": "category"},
+    ],
+    "circle_memberships": [
+        {
+            "keys": [("circle_id", ASCENDING), ("user_id", ASCENDING)],
+            "name": "circle_id_user_id_unique",
+            "unique": True
+        },
+        {"keys": [("user_id", ASCENDING), ("circle_id", ASCENDING)], "name": "user_id_circle_id"},
+        # Member listing, newest first
+        {
+            "keys": [("circle_id", ASCENDING), ("joined_at", DESCENDING), ("user_id", DESCENDING)],
+            "name": "circle_id_joined_at_user_id"
+        },
+    ],
+    "courses": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+    ],
+    "connections": [
+        {"keys": [("id", ASCENDING)], "name": "id_unique", "unique": True},
+        {
+            "keys": [("user_id", ASCENDING), ("connected_user_id", ASCENDING), ("status", ASCENDING)],
+            "name": "user_id_connected_user_id_status"
+        },
+        {
+            "keys": [("connected_user_id", ASCENDING), ("user_id", ASCENDING), ("status", ASCENDING)],
+            "name": "connected_user_id_user_id_status"
+        },
+    ],
+    "recommendations": [
+        {"keys": [("user_id", ASCENDING)], "name": "user_id_unique", "unique": True},
+    ],
+    "ws_connections": [
+        {"keys": [("user_id", ASCENDING), ("seen_at", DESCENDING)], "name": "user_id_seen_at"},
+        # Registrations of a worker that died without cleaning up
+        {"keys": [("seen_at", ASCENDING)], "name": "seen_at_ttl", "expireAfterSeconds": 600},
+    ],
+    "referrals": [
+        {"keys": [("referrer_user_id", ASCENDING)], "name": "referrer_user_id"},
+    ],
+}
+
+# Report from the most recent ensure_indexes run, exposed on /api/metrics
+last_index_report = {"status": "pending", "indexes": []}
+
+async def ensure_indexes(db) -> dict:
+    """Create every declared index that is missing and report per-index status.
+
+    create_index is a no-op for an index that already exists with the same
+    spec, so this is safe to run on every startup. A failure (for example
+    duplicate emails blocking the unique index) is reported rather than raised.
+    """
+    results = []
+    for collection, specs in INDEXES.items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                await db[collection].create_index(spec["keys"], **options)
+                results.append({"collection": collection, "name": spec["name"], "status": "ok"})
+            except Exception as e:
+                logger.error(f"Index {collection}.{spec['name']} failed: {str(e)}")
+                results.append({
+                    "collection": collection,
+                    "name": spec["name"],
+                    "status": "error",
+                    "error": str(e)
+                })
+
+    failed = [r for r in results if r["status"] == "error"]
+    last_index_report["status"] = "error" if failed else "ok"
+    last_index_report["indexes"] = results
+    logger.info(f"Ensured {len(results) - len(failed)}/{len(results)} indexes")
+    return last_index_report
+
+async def main():
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME')]
+
+    print("🔧 Ensuring XelaConnect indexes...")
+    report = await ensure_indexes(db)
+    for result in report["indexes"]:
+        marker = "✅" if result["status"] == "ok" else "❌"
+        line = f"{marker} {result['collection']}.{result['name']}"
+        if result["status"] == "error":
+            line += f" - {result['error']}"
+        print(line)
+    client.close()
+
+    if report["status"] != "ok":
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
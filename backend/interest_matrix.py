@@ -0,0 +1,183 @@
+"""
+Interest matrix for XelaConnect discover ranking
+An inverted index (interest -> rows) picks the candidates sharing at least one interest,
+and a bit-packed user x interest matrix scores them in one vectorized pass
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from auth import db
+from realtime import event_bus, on_bus_event
+from reloadable import ReloadableMirror
+
+# Full reload interval, a backstop for profile events missed by this worker
+INTEREST_MATRIX_REFRESH_SECONDS = float(os.getenv("INTEREST_MATRIX_REFRESH_SECONDS", "600"))
+# Rows are allocated in chunks so signups rarely reallocate the matrix
+ROW_CHUNK = 1024
+WORD_BITS = 64
+
+class InterestMatrix(ReloadableMirror):
+    """Users as rows, interests as bits packed into uint64 words.
+
+    Candidates come from the posting lists of the requester's interests, so
+    users sharing nothing are never touched. Scoring ANDs the candidate rows
+    with the requester's row and counts the set bits (np.bitwise_count), so
+    the shared-interest counts come out of a single vectorized operation.
+    Rows of removed users are cleared and reused rather than compacted.
+    """
+
+    name = "Interest matrix"
+
+    def __init__(self):
+        super().__init__(INTEREST_MATRIX_REFRESH_SECONDS)
+        self._vocabulary: Dict[str, int] = {}
+        # interest -> rows of users who have it
+        self._postings: Dict[str, Set[int]] = {}
+        self._words = np.zeros((0, 1), dtype=np.uint64)
+        self._user_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._interests: Dict[str, Set[str]] = {}
+        self._free_rows: List[int] = []
+        self.queries = 0
+        self.candidates_scored = 0
+
+    def _column(self, interest: str) -> int:
+        column = self._vocabulary.get(interest)
+        if column is None:
+            column = self._vocabulary[interest] = len(self._vocabulary)
+            if column // WORD_BITS >= self._words.shape[1]:
+                extra = np.zeros((self._words.shape[0], 1), dtype=np.uint64)
+                self._words = np.hstack([self._words, extra])
+        return column
+
+    def _pack(self, interests: Iterable[str]) -> np.ndarray:
+        """Bit row for a set of interests, adding unseen ones to the vocabulary"""
+        columns = [self._column(i) for i in interests]
+        row = np.zeros(self._words.shape[1], dtype=np.uint64)
+        for column in columns:
+            row[column // WORD_BITS] |= np.uint64(1) << np.uint64(column % WORD_BITS)
+        return row
+
+    def _allocate_row(self, user_id: str) -> int:
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self._user_ids[row] = user_id
+            return row
+
+        row = len(self._user_ids)
+        if row >= self._words.shape[0]:
+            extra = np.zeros((ROW_CHUNK, self._words.shape[1]), dtype=np.uint64)
+            self._words = np.vstack([self._words, extra])
+        self._user_ids.append(user_id)
+        return row
+
+    def _unpost(self, row: int, interests: Iterable[str]):
+        for interest in interests:
+            rows = self._postings.get(interest)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._postings[interest]
+
+    def upsert(self, user_id: str, interests: Iterable[str]):
+        """Add a user or replace their interests"""
+        interests = set(interests or [])
+        packed = self._pack(interests)
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._rows[user_id] = self._allocate_row(user_id)
+        else:
+            self._unpost(row, self._interests.get(user_id, set()) - interests)
+        self._words[row] = packed
+        self._interests[user_id] = interests
+        for interest in interests:
+            self._postings.setdefault(interest, set()).add(row)
+        self._record((user_id, interests))
+
+    def remove(self, user_id: str):
+        self._record((user_id, None))
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+        self._unpost(row, self._interests.pop(user_id, set()))
+        self._words[row] = 0
+        self._user_ids[row] = None
+        self._free_rows.append(row)
+
+    def interests_of(self, user_id: str) -> Set[str]:
+        return self._interests.get(user_id, set())
+
+    def top_matches(self, interests: Iterable[str], exclude: Iterable[str], k: int) -> List[Tuple[str, int]]:
+        """Up to k users sharing at least one interest, as (user_id, shared_count), best first"""
+        self.queries += 1
+        interests = set(interests)
+        if k <= 0:
+            return []
+
+        # Candidate generation: union of the posting lists, minus excluded users
+        candidates = set()
+        for interest in interests:
+            candidates |= self._postings.get(interest, set())
+        candidates -= {self._rows[u] for u in exclude if u in self._rows}
+        self.candidates_scored += len(candidates)
+        if not candidates:
+            return []
+
+        # Unknown interests have no postings, so they never reach the vocabulary here
+        query = np.zeros(self._words.shape[1], dtype=np.uint64)
+        for interest in interests:
+            column = self._vocabulary.get(interest)
+            if column is not None:
+                query[column // WORD_BITS] |= np.uint64(1) << np.uint64(column % WORD_BITS)
+
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        scores = np.bitwise_count(self._words[rows] & query).sum(axis=1, dtype=np.int32)
+
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._user_ids[rows[i]], int(scores[i])) for i in top]
+
+    async def _build(self) -> "InterestMatrix":
+        """A fresh matrix of every registered (non-guest) user"""
+        fresh = InterestMatrix()
+        cursor = db.users.find({"is_guest": {"$ne": True}}, {"_id": 0, "id": 1, "interests": 1})
+        async for user in cursor:
+            fresh.upsert(user["id"], user.get("interests", []))
+        return fresh
+
+    def _replay(self, fresh: "InterestMatrix", change: Tuple[str, Optional[Set[str]]]):
+        # (user_id, interests), or (user_id, None) for a removal
+        user_id, interests = change
+        if interests is None:
+            fresh.remove(user_id)
+        else:
+            fresh.upsert(user_id, interests)
+
+    def _swap(self, fresh: "InterestMatrix"):
+        self._vocabulary, self._words = fresh._vocabulary, fresh._words
+        self._postings = fresh._postings
+        self._user_ids, self._rows = fresh._user_ids, fresh._rows
+        self._interests, self._free_rows = fresh._interests, fresh._free_rows
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "users": len(self._rows),
+            "interests": len(self._vocabulary),
+            "matrix_bytes": int(self._words.nbytes),
+            "queries": self.queries,
+            "candidates_scored": self.candidates_scored
+        }
+
+interest_matrix = InterestMatrix()
+
+async def publish_interests(user_id: str, interests: List[str]):
+    """Tell every worker's matrix about a new or changed set of interests"""
+    await event_bus.publish("interests", {"user_id": user_id, "interests": list(interests or [])})
+
+@on_bus_event("interests")
+async def sync_interest_matrix(message: dict):
+    interest_matrix.upsert(message["user_id"], message["interests"])
@@ -0,0 +1,122 @@
+"""
+Bucketed message storage for XelaConnect conversations
+Messages live in the messages collection, MESSAGE_BUCKET_SIZE per bucket document
+
+Each conversation has at most one open bucket (open: True, enforced by the
+conversation_id_open_unique partial index) and only that bucket receives
+new messages. Migrated buckets are never open.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+import os
+import uuid
+from pymongo.errors import DuplicateKeyError
+from auth import db
+
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "100"))
+
+def new_bucket(conversation_id: str, messages: list, **extra) -> dict:
+    """Build a bucket document holding the given (timestamp-ordered) messages"""
+    return {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "messages": messages,
+        "count": len(messages),
+        "first_at": messages[0]["timestamp"],
+        "last_at": messages[-1]["timestamp"],
+        "created_at": datetime.utcnow(),
+        **extra
+    }
+
+async def append_messages(conversation_id: str, messages: list):
+    """Append messages to the conversation's open bucket.
+
+    The common case is a single write. When the open bucket lacks room it
+    is sealed and a new open bucket is inserted; if a concurrent writer
+    inserted one first, the unique partial index rejects ours and we
+    append to theirs instead.
+    """
+    room = MESSAGE_BUCKET_SIZE - len(messages)
+    while True:
+        result = await db.messages.update_one(
+            {"conversation_id": conversation_id, "open": True, "count": {"$lte": room}},
+            {
+                "$push": {"messages": {"$each": messages}},
+                "$inc": {"count": len(messages)},
+                "$min": {"first_at": messages[0]["timestamp"]},
+                "$max": {"last_at": messages[-1]["timestamp"]}
+            }
+        )
+        if result.matched_count:
+            return
+
+        # Seal the open bucket only if it is still too full for us
+        await db.messages.update_one(
+            {"conversation_id": conversation_id, "open": True, "count": {"$gt": room}},
+            {"$unset": {"open": ""}}
+        )
+        try:
+            await db.messages.insert_one(new_bucket(conversation_id, messages, open=True))
+            return
+        except DuplicateKeyError:
+            continue
+
+async def get_recent_messages(conversation_id: str, limit: int = 50) -> list:
+    """Return the latest `limit` messages, oldest first, reading only the newest buckets"""
+    messages, _ = await get_messages_page(conversation_id, limit=limit)
+    return messages
+
+def _sort_key(message: dict):
+    return (message["timestamp"], message["message_id"])
+
+async def get_messages_page(
+    conversation_id: str,
+    before: Optional[Tuple[datetime, str]] = None,
+    after: Optional[Tuple[datetime, str]] = None,
+    limit: int = 50
+) -> Tuple[list, bool]:
+    """Return one page of messages (oldest first) and whether more exist in that direction.
+
+    `before` walks back through history from a (timestamp, message_id) key,
+    `after` walks forward from one; with neither, the latest page is returned.
+    Only the buckets overlapping the page are read.
+
+    Bucket time ranges can overlap (concurrent rollovers, or the last
+    migrated bucket next to a live one), so reading does not stop at the
+    first bucket that fills the page: it stops once the next bucket cannot
+    hold anything inside the page's boundary.
+    """
+    query = {"conversation_id": conversation_id}
+    if after:
+        # Walk forward by bucket start; a later-starting bucket cannot hold earlier messages
+        query["last_at"] = {"$gte": after[0]}
+        sort_field, sort_direction, reach = "first_at", 1, "first_at"
+    else:
+        # Walk back by bucket end; an earlier-ending bucket cannot hold later messages
+        if before:
+            query["first_at"] = {"$lte": before[0]}
+        sort_field, sort_direction, reach = "last_at", -1, "last_at"
+
+    messages = []
+    cursor = db.messages.find(
+        query,
+        {"_id": 0, "messages": 1, "first_at": 1, "last_at": 1}
+    ).sort(sort_field, sort_direction).batch_size(2)
+    async for bucket in cursor:
+        # One extra message tells us whether another page exists
+        if len(messages) > limit:
+            messages.sort(key=_sort_key, reverse=not after)
+            boundary = messages[limit]["timestamp"]
+            if (after and bucket[reach] > boundary) or (not after and bucket[reach] < boundary):
+                break
+        for message in bucket.get("messages", []):
+            key = _sort_key(message)
+            if (after and key <= after) or (before and key >= before):
+                continue
+            messages.append(message)
+    await cursor.close()
+
+    messages.sort(key=_sort_key)
+    has_more = len(messages) > limit
+    page = messages[:limit] if after else messages[-limit:]
+    return page, has_more
@@ -1,15 +1,51 @@
 """
 Real-time messaging endpoints for XelaConnect
 """
-from fastapi import APIRouter, Depends, HTTPException
-from datetime import datetime
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timedelta
+from typing import List, Optional
+from pymongo import ReturnDocument
 from models import Message
 from auth import get_current_user, db
+from message_store import append_messages, get_messages_page
+from pagination import encode_cursor, decode_cursor
+from realtime import on_bus_event, on_client_event, publish_to_users
+from typing_store import typing_store
+from blocklist import block_list
 import uuid
 
 messaging_router = APIRouter(prefix="/messaging")
 
+# Fields needed to render the other participant in a conversation list
+USER_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "name": 1, "picture": 1, "is_online": 1}
+
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 100
+# Messages are stamped before they are appended, so one stamped just before the previous
+# mark-read can land in its bucket just after; buckets this much older are re-checked
+MARK_READ_SLACK = timedelta(minutes=1)
+
+async def get_user_summaries(user_ids) -> dict:
+    """Fetch slim user summaries for many ids with a single $in query, keyed by id"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    
+    users = await db.users.find(
+        {"id": {"$in": user_ids}},
+        USER_SUMMARY_PROJECTION
+    ).to_list(len(user_ids))
+    
+    return {u["id"]: u for u in users}
+
+def _message_page(messages: list, has_more: bool) -> dict:
+    """Page metadata: cursors for the oldest and newest message returned"""
+    return {
+        "has_more": has_more,
+        "before_cursor": encode_cursor(messages[0]["timestamp"], messages[0]["message_id"]) if messages else None,
+        "after_cursor": encode_cursor(messages[-1]["timestamp"], messages[-1]["message_id"]) if messages else None
+    }
+
 @messaging_router.get("/conversations")
 async def get_conversations(user = Depends(get_current_user)):
     """Get all conversations for current user"""
@@ -19,21 +55,23 @@ async def get_conversations(user = Depends(get_current_user)):
             {"with_user_id": user["id"]}
         ],
         "type": "user_to_user"
-    }).sort("last_message_at", -1).to_list(100)
+    }, {"messages": 0}).sort("last_message_at", -1).to_list(100)
+    
+    # Resolve every other participant in one query
+    other_user_ids = {
+        conv["with_user_id"] if conv["user_id"] == user["id"] else conv["user_id"]
+        for conv in conversations
+    }
+    other_users = await get_user_summaries(other_user_ids)
     
-    # Get other user details for each conversation
     for conv in conversations:
         other_user_id = conv["with_user_id"] if conv["user_id"] == user["id"] else conv["user_id"]
-        other_user = await db.users.find_one({"id": other_user_id})
-        if other_user:
-            if "_id" in other_user:
-                del other_user["_id"]
-            if "password_hash" in other_user:
-                del other_user["password_hash"]
-            conv["other_user"] = other_user
+        if other_user_id in other_users:
+            conv["other_user"] = other_users[other_user_id]
         
         if "_id" in conv:
             del conv["_id"]
+        conv["unread_count"] = conv.pop("unread_counts", {}).get(user["id"], 0)
     
     return {"conversations": conversations}
 
@@ -47,7 +85,7 @@ async def get_conversation_with_user(user_id: str, user = Depends(get_current_us
             {"user_id": user_id, "with_user_id": user["id"]}
         ],
         "type": "user_to_user"
-    })
+    }, {"messages": 0})
     
     if not conversation:
         # Create new conversation
@@ -56,7 +94,6 @@ async def get_conversation_with_user(user_id: str, user = Depends(get_current_us
             "user_id": user["id"],
             "with_user_id": user_id,
             "type": "user_to_user",
-            "messages": [],
             "last_message_at": datetime.utcnow(),
             "created_at": datetime.utcnow()
         }
@@ -74,8 +111,45 @@ async def get_conversation_with_user(user_id: str, user = Depends(get_current_us
     if "_id" in conversation:
         del conversation["_id"]
     
+    # Only the latest page; older history comes from the messages endpoint
+    messages, has_more = await get_messages_page(conversation["id"], limit=MESSAGE_PAGE_SIZE)
+    conversation["messages"] = messages
+    conversation["messages_page"] = _message_page(messages, has_more)
+    
     return {"conversation": conversation}
 
+@messaging_router.get("/conversations/{user_id}/messages")
+async def get_message_history(
+    user_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+    user = Depends(get_current_user)
+):
+    """Get a page of message history with a user (keyset pagination)"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
+    conversation = await db.conversations.find_one({
+        "$or": [
+            {"user_id": user["id"], "with_user_id": user_id},
+            {"user_id": user_id, "with_user_id": user["id"]}
+        ],
+        "type": "user_to_user"
+    }, {"_id": 0, "id": 1})
+    
+    if not conversation:
+        return {"messages": [], **_message_page([], False)}
+    
+    messages, has_more = await get_messages_page(
+        conversation["id"],
+        before=decode_cursor(before),
+        after=decode_cursor(after),
+        limit=limit
+    )
+    
+    return {"messages": messages, **_message_page(messages, has_more)}
+
 @messaging_router.post("/conversations/{user_id}/messages")
 async def send_message(user_id: str, message_data: dict, user = Depends(get_current_user)):
     """Send message to user"""
@@ -83,6 +157,9 @@ async def send_message(user_id: str, message_data: dict, user = Depends(get_curr
     if not message_text:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
+    if not block_list.can_message(user["id"], user_id):
+        raise HTTPException(status_code=403, detail="You cannot message this user")
+    
     # Find or create conversation
     conversation = await db.conversations.find_one({
         "$or": [
@@ -90,7 +167,7 @@ async def send_message(user_id: str, message_data: dict, user = Depends(get_curr
             {"user_id": user_id, "with_user_id": user["id"]}
         ],
         "type": "user_to_user"
-    })
+    }, {"_id": 0, "id": 1})
     
     if not conversation:
         conversation = {
@@ -98,7 +175,6 @@ async def send_message(user_id: str, message_data: dict, user = Depends(get_curr
             "user_id": user["id"],
             "with_user_id": user_id,
             "type": "user_to_user",
-            "messages": [],
             "last_message_at": datetime.utcnow(),
             "created_at": datetime.utcnow()
         }
@@ -115,15 +191,26 @@ async def send_message(user_id: str, message_data: dict, user = Depends(get_curr
         "delivered": True
     }
     
-    # Add message to conversation
+    # Append to the conversation's message buckets
+    await append_messages(conversation["id"], [new_message])
     await db.conversations.update_one(
         {"id": conversation["id"]},
         {
-            "$push": {"messages": new_message},
-            "$set": {"last_message_at": datetime.utcnow()}
+            "$set": {
+                "last_message_at": new_message["timestamp"],
+                "last_message": new_message
+            },
+            "$inc": {f"unread_counts.{user_id}": 1}
         }
     )
     
+    # Push to the recipient and the sender's other devices
+    await publish_to_users(
+        [user_id, user["id"]],
+        "message",
+        {"conversation_id": conversation["id"], "message": new_message}
+    )
+    
     # TODO: Send push notification to recipient
     
     return {"message": new_message}
@@ -131,52 +218,94 @@ async def send_message(user_id: str, message_data: dict, user = Depends(get_curr
 @messaging_router.post("/conversations/{conversation_id}/read")
 async def mark_messages_read(conversation_id: str, user = Depends(get_current_user)):
     """Mark all messages in conversation as read"""
-    conversation = await db.conversations.find_one({"id": conversation_id})
+    # Move this participant's read watermark up to the latest message
+    read_at = datetime.utcnow()
+    conversation = await db.conversations.find_one_and_update(
+        {
+            "id": conversation_id,
+            "$or": [{"user_id": user["id"]}, {"with_user_id": user["id"]}]
+        },
+        [{
+            "$set": {
+                f"read_state.{user['id']}": {
+                    "last_read_at": read_at,
+                    "last_read_message_id": "$last_message.message_id"
+                },
+                f"unread_counts.{user['id']}": 0
+            }
+        }],
+        projection={"_id": 0, "id": 1, "user_id": 1, "with_user_id": 1, f"read_state.{user['id']}": 1},
+        return_document=ReturnDocument.BEFORE
+    )
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Mark all messages from other user as read
-    for msg in conversation.get("messages", []):
-        if msg["sender_id"] != user["id"]:
-            msg["read"] = True
+    # Flip per-message flags only in buckets that still hold unread messages from the other user.
+    # The previous watermark limits the scan to buckets written since, via conversation_id_last_at,
+    # so the work no longer grows with the conversation's history.
+    bucket_query = {
+        "conversation_id": conversation_id,
+        "messages": {"$elemMatch": {"sender_id": {"$ne": user["id"]}, "read": False}}
+    }
+    previous_read_at = conversation.get("read_state", {}).get(user["id"], {}).get("last_read_at")
+    if previous_read_at:
+        bucket_query["last_at"] = {"$gt": previous_read_at - MARK_READ_SLACK}
+    await db.messages.update_many(
+        bucket_query,
+        {"$set": {"messages.$[msg].read": True}},
+        array_filters=[{"msg.sender_id": {"$ne": user["id"]}, "msg.read": False}]
+    )
     
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"messages": conversation["messages"]}}
+    other_user_id = conversation["with_user_id"] if conversation["user_id"] == user["id"] else conversation["user_id"]
+    await publish_to_users(
+        [other_user_id, user["id"]],
+        "read_receipt",
+        {"conversation_id": conversation_id, "reader_id": user["id"], "last_read_at": read_at}
     )
     
     return {"message": "Messages marked as read"}
 
+async def record_typing(user_id: str, typing_to: str, is_typing: bool):
+    """Publish a typing indicator; every worker's in-memory store picks it up.
+
+    Clients send "typing" on every keystroke, so indicators that would not
+    change anything are dropped here (TypingStore.should_publish) to keep the
+    Mongo bus to a couple of writes per TTL per conversation.
+    """
+    if not block_list.can_message(user_id, typing_to):
+        return
+    if not typing_store.should_publish(user_id, typing_to, is_typing):
+        return
+    await publish_to_users([typing_to], "typing", {"user_id": user_id, "is_typing": is_typing})
+
+@on_bus_event("typing")
+async def sync_typing_store(message: dict):
+    """Mirror typing events into this worker's typing store"""
+    data = message["payload"]["data"]
+    for typing_to in message["user_ids"]:
+        typing_store.set(data["user_id"], typing_to, data["is_typing"])
+
 @messaging_router.post("/typing")
 async def send_typing_indicator(data: dict, user = Depends(get_current_user)):
-    """Send typing indicator (to be handled by websocket in production)"""
+    """Send typing indicator (WebSocket clients send a "typing" event instead)"""
     user_id = data.get("user_id")
     is_typing = data.get("is_typing", True)
     
-    # Store typing status temporarily (use Redis in production)
-    await db.typing_indicators.update_one(
-        {"user_id": user["id"], "typing_to": user_id},
-        {
-            "$set": {
-                "is_typing": is_typing,
-                "timestamp": datetime.utcnow()
-            }
-        },
-        upsert=True
-    )
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id required")
+    
+    await record_typing(user["id"], user_id, is_typing)
     
     return {"status": "typing indicator sent"}
 
+@on_client_event("typing")
+async def handle_typing_event(user: dict, event: dict):
+    """Typing event sent over the WebSocket: {"type": "typing", "user_id": ..., "is_typing": ...}"""
+    if event.get("user_id"):
+        await record_typing(user["id"], event["user_id"], bool(event.get("is_typing", True)))
+
 @messaging_router.get("/typing/{user_id}")
 async def get_typing_indicator(user_id: str, user = Depends(get_current_user)):
     """Check if user is typing"""
-    indicator = await db.typing_indicators.find_one({
-        "user_id": user_id,
-        "typing_to": user["id"]
-    })
-    
-    if indicator and (datetime.utcnow() - indicator["timestamp"]).seconds < 5:
-        return {"is_typing": indicator.get("is_typing", False)}
-    
-    return {"is_typing": False}
+    return {"is_typing": typing_store.is_typing(user_id, user["id"])}
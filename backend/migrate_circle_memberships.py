@@ -0,0 +1,67 @@
+"""
+Migrate embedded circles.members arrays into the circle_memberships collection
+Safe to re-run: existing memberships are left untouched
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+from circle_memberships import new_membership
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ.get('MONGO_URL')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME')]
+
+async def migrate_circle(circle: dict) -> int:
+    """Move one circle's embedded members into membership documents"""
+    # The arrays never recorded join times, so every migrated member gets the migration time
+    operations = [
+        UpdateOne(
+            {"circle_id": circle["id"], "user_id": user_id},
+            {"$setOnInsert": new_membership(circle["id"], user_id, migrated=True)},
+            upsert=True
+        )
+        for user_id in set(circle["members"])
+    ]
+    result = await db.circle_memberships.bulk_write(operations, ordered=False)
+
+    await db.circles.update_one(
+        {"id": circle["id"]},
+        {"$unset": {"members": ""}}
+    )
+    return result.upserted_count
+
+async def migrate_circle_memberships():
+    """Migrate every circle that still embeds members"""
+    circles = db.circles.find(
+        {"members.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "members": 1}
+    )
+
+    migrated_circles = 0
+    migrated_members = 0
+    async for circle in circles:
+        migrated_members += await migrate_circle(circle)
+        migrated_circles += 1
+
+    # Circles that never had a member just lose the empty array
+    await db.circles.update_many(
+        {"members": {"$size": 0}},
+        {"$unset": {"members": ""}}
+    )
+
+    print(f"✅ Migrated {migrated_members} memberships from {migrated_circles} circles")
+
+async def main():
+    print("📦 Migrating XelaConnect circle memberships...")
+    await migrate_circle_memberships()
+    print("✨ Circle membership migration complete!")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Migrate embedded conversations.messages arrays into the bucketed messages collection
+Safe to re-run: buckets written by an interrupted run are replaced, live buckets are kept
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+from message_store import MESSAGE_BUCKET_SIZE, new_bucket
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+mongo_url = os.environ.get('MONGO_URL')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME')]
+
+async def migrate_conversation(conversation: dict) -> int:
+    """Move one conversation's embedded messages into buckets"""
+    messages = sorted(conversation["messages"], key=lambda m: m["timestamp"])
+
+    # Replace anything left behind by an earlier, interrupted run
+    await db.messages.delete_many({"conversation_id": conversation["id"], "migrated": True})
+
+    # Written without open: True, so live sends never land in (and get deleted with) these
+    buckets = [
+        new_bucket(conversation["id"], messages[i:i + MESSAGE_BUCKET_SIZE], migrated=True)
+        for i in range(0, len(messages), MESSAGE_BUCKET_SIZE)
+    ]
+    await db.messages.insert_many(buckets)
+
+    await db.conversations.update_one(
+        {"id": conversation["id"]},
+        {
+            "$set": {"last_message": messages[-1]},
+            "$unset": {"messages": ""}
+        }
+    )
+    return len(messages)
+
+async def migrate_messages():
+    """Migrate every conversation that still embeds messages"""
+    conversations = db.conversations.find(
+        {"messages.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "messages": 1}
+    )
+
+    migrated_conversations = 0
+    migrated_messages = 0
+    async for conversation in conversations:
+        migrated_messages += await migrate_conversation(conversation)
+        migrated_conversations += 1
+
+    # Conversations that never had a message just lose the empty array
+    await db.conversations.update_many(
+        {"messages": {"$size": 0}},
+        {"$unset": {"messages": ""}}
+    )
+
+    print(f"✅ Migrated {migrated_messages} messages from {migrated_conversations} conversations")
+
+async def main():
+    print("📦 Migrating XelaConnect messages into buckets...")
+    await migrate_messages()
+    print("✨ Message migration complete!")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
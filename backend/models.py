@@ -57,7 +57,6 @@ class Circle(BaseModel):
     gradient: str  # Gradient colors for display
     tags: List[str] = []
     members_count: int = 0
-    members: List[str] = []
     active: bool = True
     created_by: str
     created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
@@ -0,0 +1,65 @@
+"""
+Opaque keyset cursors for XelaConnect list endpoints
+A cursor encodes the (timestamp, id) of the last item a client has seen
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException
+
+SortKey = Tuple[datetime, str]
+
+def encode_cursor(timestamp: datetime, item_id: str) -> str:
+    """Encode a (timestamp, id) sort key as a URL-safe cursor"""
+    raw = f"{timestamp.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[SortKey]:
+    """Decode a cursor back into its (timestamp, id) sort key, or raise 400"""
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), item_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(field: str, after: Optional[SortKey], id_field: str = "id") -> dict:
+    """Filter for the items after a (field, id_field) sort key in newest-first order; {} on the first page"""
+    if not after:
+        return {}
+    return {"$or": [
+        {field: {"$lt": after[0]}},
+        {field: after[0], id_field: {"$lt": after[1]}}
+    ]}
+
+async def keyset_page(
+    collection,
+    query: dict,
+    projection: dict,
+    after: Optional[SortKey],
+    limit: int,
+    field: str,
+    id_field: str = "id"
+) -> Tuple[list, Optional[str]]:
+    """Fetch one newest-first page and the cursor for the next one (None on the last page).
+
+    Backed by an index on (..equality fields.., field, id_field), the query
+    walks the index from the cursor and stops after limit + 1 documents; the
+    extra one only tells whether another page exists. The projection must
+    keep field and id_field.
+    """
+    page_filter = keyset_filter(field, after, id_field)
+    if page_filter:
+        query = {"$and": [query, page_filter]} if "$or" in query else {**query, **page_filter}
+
+    items = await collection.find(query, projection).sort(
+        [(field, -1), (id_field, -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1][field], items[-1][id_field])
@@ -1,59 +1,73 @@
 """
 User presence and safety features for XelaConnect
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from datetime import datetime, timedelta
-from auth import get_current_user, db
+from typing import Optional
+from auth import get_current_user, db, invalidate_user
+from realtime import on_connection_change, presence_visibility, publish_presence
+from presence_engine import PresenceEngine
+from pagination import decode_cursor, keyset_page
+from blocklist import block_list, publish_block_change
 import uuid
 
 presence_router = APIRouter(prefix="/presence")
 safety_router = APIRouter(prefix="/safety")
 
+# Heartbeats are coalesced here and flushed to users in batches
+presence_engine = PresenceEngine(db)
+
+MAX_STATUS_BATCH = 500
+PRESENCE_STATUS_PROJECTION = {"_id": 0, "id": 1, "is_online": 1, "last_active": 1}
+
+# Fields needed to render a user in presence lists
+PRESENCE_USER_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "picture": 1, "identity_badge": 1, "city": 1,
+    "is_online": 1, "last_active": 1
+}
+
 # ==================== PRESENCE ENDPOINTS ====================
 
+async def update_presence(user_id: str, is_online: bool):
+    """Record a heartbeat and push the change to subscribers if the online flag flipped"""
+    if presence_engine.touch(user_id, is_online):
+        last_active = presence_engine.get(user_id)["last_active"]
+        await publish_presence(user_id, "online" if is_online else "offline", last_active)
+
+@on_connection_change
+async def handle_connection_change(user_id: str, is_online: bool):
+    """A user's first WebSocket opened or last one closed"""
+    await update_presence(user_id, is_online)
+
+@presence_visibility
+def presence_visible_across_blocks(viewer_id: str, user_id: str) -> bool:
+    """Neither side of a block sees the other's presence"""
+    return block_list.can_message(viewer_id, user_id)
+
 @presence_router.post("/online")
 async def set_online(user = Depends(get_current_user)):
     """Set user as online"""
-    await db.users.update_one(
-        {"id": user["id"]},
-        {
-            "$set": {
-                "last_active": datetime.utcnow(),
-                "is_online": True
-            }
-        }
-    )
+    await update_presence(user["id"], True)
     return {"status": "online"}
 
 @presence_router.post("/offline")
 async def set_offline(user = Depends(get_current_user)):
     """Set user as offline"""
-    await db.users.update_one(
-        {"id": user["id"]},
-        {
-            "$set": {
-                "last_active": datetime.utcnow(),
-                "is_online": False
-            }
-        }
-    )
+    await update_presence(user["id"], False)
     return {"status": "offline"}
 
-@presence_router.get("/status/{user_id}")
-async def get_user_status(user_id: str):
-    """Get user's online status"""
-    user = await db.users.find_one({"id": user_id})
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def _presence_status(user: dict) -> dict:
+    """Derive status from a user's last_active, preferring unflushed heartbeats"""
+    # Heartbeats not yet flushed are fresher than the database
+    presence_engine.merge(user)
     
-    is_online = user.get("is_online", False)
     last_active = user.get("last_active", datetime.utcnow())
+    idle_seconds = (datetime.utcnow() - last_active).total_seconds()
     
     # If last active was less than 5 minutes ago, consider online
-    if (datetime.utcnow() - last_active).seconds < 300:
+    if idle_seconds < 300:
         status = "online"
-    elif (datetime.utcnow() - last_active).seconds < 3600:
+    elif idle_seconds < 3600:
         status = "recently_active"
     else:
         status = "offline"
@@ -63,23 +77,74 @@ async def get_user_status(user_id: str):
         "last_active": last_active.isoformat()
     }
 
+@presence_router.get("/status/{user_id}")
+async def get_user_status(user_id: str, viewer = Depends(get_current_user)):
+    """Get user's online status"""
+    # Blocked in either direction looks the same as an unknown user
+    user = None
+    if block_list.can_message(viewer["id"], user_id):
+        user = await db.users.find_one({"id": user_id}, PRESENCE_STATUS_PROJECTION)
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return _presence_status(user)
+
+@presence_router.post("/status/batch")
+async def get_user_statuses(data: dict, viewer = Depends(get_current_user)):
+    """Get online status for many users at once: {"user_ids": [...]}"""
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list) or not all(isinstance(u, str) for u in user_ids):
+        raise HTTPException(status_code=400, detail="user_ids must be a list of strings")
+    
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > MAX_STATUS_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATUS_BATCH} user_ids per request")
+    
+    hidden = block_list.hidden_from(viewer["id"])
+    user_ids = [u for u in user_ids if u not in hidden]
+    if not user_ids:
+        return {"statuses": {}}
+    
+    users = await db.users.find(
+        {"id": {"$in": user_ids}},
+        PRESENCE_STATUS_PROJECTION
+    ).to_list(len(user_ids))
+    
+    # Unknown and blocked ids are omitted
+    return {"statuses": {u["id"]: _presence_status(u) for u in users}}
+
 @presence_router.get("/online-users")
-async def get_online_users(user = Depends(get_current_user)):
-    """Get list of online users"""
+async def get_online_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    user = Depends(get_current_user)
+):
+    """Get recently active users, most recent first (keyset pagination on last_active, id)"""
     five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
     
-    online_users = await db.users.find({
-        "id": {"$ne": user["id"]},
-        "last_active": {"$gte": five_minutes_ago}
-    }).to_list(100)
+    # last_active_id index
+    online_users, next_cursor = await keyset_page(
+        db.users,
+        {
+            "id": {"$nin": [user["id"], *block_list.hidden_from(user["id"])]},
+            "last_active": {"$gte": five_minutes_ago}
+        },
+        PRESENCE_USER_PROJECTION,
+        decode_cursor(cursor),
+        limit,
+        "last_active"
+    )
     
     for u in online_users:
-        if "_id" in u:
-            del u["_id"]
-        if "password_hash" in u:
-            del u["password_hash"]
+        presence_engine.merge(u)
     
-    return {"online_users": online_users, "count": len(online_users)}
+    return {
+        "online_users": online_users,
+        "count": len(online_users),
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
 
 # ==================== BLOCK & REPORT ENDPOINTS ====================
 
@@ -94,6 +159,8 @@ async def block_user(user_id: str, user = Depends(get_current_user)):
         {"id": user["id"]},
         {"$addToSet": {"blocked_users": user_id}}
     )
+    await invalidate_user(user["id"])
+    await publish_block_change(user["id"], user_id, True)
     
     # Remove any existing connections
     await db.connections.delete_many({
@@ -112,25 +179,23 @@ async def unblock_user(user_id: str, user = Depends(get_current_user)):
         {"id": user["id"]},
         {"$pull": {"blocked_users": user_id}}
     )
+    await invalidate_user(user["id"])
+    await publish_block_change(user["id"], user_id, False)
     
     return {"message": "User unblocked successfully"}
 
 @safety_router.get("/blocked")
 async def get_blocked_users(user = Depends(get_current_user)):
     """Get list of blocked users"""
-    user_data = await db.users.find_one({"id": user["id"]})
-    blocked_ids = user_data.get("blocked_users", [])
+    blocked_ids = list(block_list.blocked_ids(user["id"]))
     
     if not blocked_ids:
         return {"blocked_users": []}
     
-    blocked_users = await db.users.find({"id": {"$in": blocked_ids}}).to_list(100)
-    
-    for u in blocked_users:
-        if "_id" in u:
-            del u["_id"]
-        if "password_hash" in u:
-            del u["password_hash"]
+    blocked_users = await db.users.find(
+        {"id": {"$in": blocked_ids}},
+        PRESENCE_USER_PROJECTION
+    ).to_list(len(blocked_ids))
     
     return {"blocked_users": blocked_users}
 
@@ -161,15 +226,8 @@ async def report_user(report_data: dict, user = Depends(get_current_user)):
 @safety_router.get("/is-blocked/{user_id}")
 async def check_if_blocked(user_id: str, user = Depends(get_current_user)):
     """Check if a user is blocked"""
-    user_data = await db.users.find_one({"id": user["id"]})
-    blocked_ids = user_data.get("blocked_users", [])
-    
-    # Also check if we are blocked by them
-    other_user_data = await db.users.find_one({"id": user_id})
-    blocked_by_them = user["id"] in other_user_data.get("blocked_users", [])
-    
     return {
-        "is_blocked_by_me": user_id in blocked_ids,
-        "is_blocked_by_them": blocked_by_them,
-        "can_message": user_id not in blocked_ids and not blocked_by_them
+        "is_blocked_by_me": block_list.is_blocked(user["id"], user_id),
+        "is_blocked_by_them": block_list.is_blocked(user_id, user["id"]),
+        "can_message": block_list.can_message(user["id"], user_id)
     }
@@ -0,0 +1,143 @@
+"""
+Heartbeat-coalescing presence engine for XelaConnect
+Keeps last-seen state in memory and flushes it to users in periodic bulk writes
+
+Crash safety: a worker that dies loses at most PRESENCE_FLUSH_INTERVAL_SECONDS
+of heartbeats. Nothing else depends on them, and the next heartbeat from each
+client restores its state. Flushes take the newer last_active, and only set
+is_online when their heartbeat is at least as new as the stored one, so
+workers flushing in any order never move either field backwards.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_INTERVAL_SECONDS = float(os.getenv("PRESENCE_FLUSH_INTERVAL_SECONDS", "10"))
+# Clean entries older than this are dropped from memory after a flush
+PRESENCE_RETENTION = timedelta(hours=1)
+# Stands in for a missing last_active when comparing heartbeats
+NEVER_ACTIVE = datetime(1970, 1, 1)
+
+def presence_update(state: dict) -> list:
+    """Pipeline update applying a heartbeat only where it is not older than the stored one.
+
+    Both expressions in the $set stage read the document as stored, so the
+    is_online check compares against last_active before this write.
+    """
+    fields = {"last_active": {"$max": ["$last_active", state["last_active"]]}}
+    if state["is_online"] is not None:
+        fields["is_online"] = {
+            "$cond": [
+                {"$gte": [state["last_active"], {"$ifNull": ["$last_active", NEVER_ACTIVE]}]},
+                state["is_online"],
+                "$is_online"
+            ]
+        }
+    return [{"$set": fields}]
+
+class PresenceEngine:
+    """In-memory last-seen state with batched persistence"""
+
+    def __init__(self, db, flush_interval: float = PRESENCE_FLUSH_INTERVAL_SECONDS):
+        self._db = db
+        self.flush_interval = flush_interval
+        # user_id -> {"last_active": datetime, "is_online": Optional[bool]}
+        self._state: Dict[str, dict] = {}
+        self._dirty = set()
+        self._task: Optional[asyncio.Task] = None
+        self.heartbeats = 0
+        self.flushes = 0
+        self.writes = 0
+        self.flush_errors = 0
+
+    def touch(self, user_id: str, is_online: Optional[bool] = None) -> bool:
+        """Record activity; is_online=None keeps the current flag.
+
+        Returns True when the user's online flag changed, so callers only
+        broadcast real transitions rather than every heartbeat.
+        """
+        self.heartbeats += 1
+        previous = self._state.get(user_id)
+        previous_online = previous.get("is_online") if previous else None
+        if is_online is None:
+            is_online = previous_online
+
+        self._state[user_id] = {"last_active": datetime.utcnow(), "is_online": is_online}
+        self._dirty.add(user_id)
+        return is_online is not None and is_online != previous_online
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Latest state seen by this worker, or None"""
+        return self._state.get(user_id)
+
+    def merge(self, user: dict) -> dict:
+        """Overlay unflushed state onto a user document read from the database"""
+        state = self._state.get(user.get("id"))
+        if state:
+            stored = user.get("last_active")
+            if stored is None or state["last_active"] > stored:
+                user["last_active"] = state["last_active"]
+                if state["is_online"] is not None:
+                    user["is_online"] = state["is_online"]
+        return user
+
+    async def flush(self):
+        """Write every changed user in one unordered bulk_write"""
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        operations = []
+        for user_id in dirty:
+            operations.append(UpdateOne({"id": user_id}, presence_update(self._state[user_id])))
+
+        try:
+            await self._db.users.bulk_write(operations, ordered=False)
+            self.flushes += 1
+            self.writes += len(operations)
+        except Exception as e:
+            # Retry on the next tick; newer heartbeats simply overwrite the state
+            self._dirty |= dirty
+            self.flush_errors += 1
+            logger.error(f"Presence flush failed: {str(e)}")
+            return
+
+        cutoff = datetime.utcnow() - PRESENCE_RETENTION
+        for user_id in [u for u, s in self._state.items() if s["last_active"] < cutoff and u not in self._dirty]:
+            del self._state[user_id]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and persist whatever is pending"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "tracked_users": len(self._state),
+            "pending_writes": len(self._dirty),
+            "heartbeats": self.heartbeats,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "flush_errors": self.flush_errors,
+            "flush_interval_seconds": self.flush_interval
+        }
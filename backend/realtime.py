@@ -0,0 +1,356 @@
+"""
+Real-time WebSocket hub for XelaConnect
+Pushes new messages, typing events, read receipts and presence changes to connected clients
+Events travel over the event bus so they reach sockets held by any worker
+"""
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+from auth import resolve_session_user, db, apply_session_invalidation, SESSION_CACHE_CHANNEL
+from event_bus import create_event_bus
+from pymongo import UpdateOne
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# A client that has not authenticated within this many seconds of connecting is dropped
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+# A socket that cannot take an event within this many seconds is closed rather than waited on
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "2"))
+# Each worker refreshes its socket registrations this often; entries three times older are dead
+WS_REGISTRY_HEARTBEAT_SECONDS = float(os.getenv("WS_REGISTRY_HEARTBEAT_SECONDS", "30"))
+
+realtime_router = APIRouter()
+
+# Client -> server event handlers, registered by feature modules (e.g. messaging typing)
+_client_event_handlers = {}
+# Called with (user_id, is_online) when a user's first socket opens or last socket closes
+_connection_handlers = []
+# Event bus channel -> handlers run on every worker, e.g. to keep shared in-memory state in sync
+_bus_listeners = {}
+# Checks (viewer_id, user_id) -> bool deciding who may watch whose presence, e.g. blocks
+_presence_visibility_checks = []
+
+def on_client_event(event_type: str):
+    """Register a handler for an event type sent by clients over the socket"""
+    def decorator(func):
+        _client_event_handlers[event_type] = func
+        return func
+    return decorator
+
+def on_bus_event(channel: str):
+    """Register a handler run on every worker for each event published on a channel"""
+    def decorator(func):
+        _bus_listeners.setdefault(channel, []).append(func)
+        return func
+    return decorator
+
+def on_connection_change(func):
+    """Register a handler for users coming online or going offline on this worker"""
+    _connection_handlers.append(func)
+    return func
+
+def presence_visibility(func):
+    """Register a check (viewer_id, user_id) -> bool applied to presence subscriptions and pushes"""
+    _presence_visibility_checks.append(func)
+    return func
+
+def can_see_presence(viewer_id: str, user_id: str) -> bool:
+    return all(check(viewer_id, user_id) for check in _presence_visibility_checks)
+
+class ConnectionManager:
+    """Registry of authenticated sockets on this worker, keyed by user id"""
+
+    def __init__(self):
+        self._connections: Dict[str, Set[WebSocket]] = {}
+        # user_id -> sockets that asked for that user's presence changes
+        self._presence_subscribers: Dict[str, Set[WebSocket]] = {}
+        self._subscriptions: Dict[WebSocket, Set[str]] = {}
+        self._socket_users: Dict[WebSocket, str] = {}
+        # Slow sockets being closed; nothing more is sent to them
+        self._closing: Set[WebSocket] = set()
+        self._close_tasks: Set[asyncio.Task] = set()
+        self.events_sent = 0
+        self.slow_sockets_dropped = 0
+
+    def connect(self, user_id: str, websocket: WebSocket) -> bool:
+        """Register a socket; returns True if it is the user's first one"""
+        self._socket_users[websocket] = user_id
+        sockets = self._connections.setdefault(user_id, set())
+        sockets.add(websocket)
+        return len(sockets) == 1
+
+    def disconnect(self, user_id: str, websocket: WebSocket) -> bool:
+        """Unregister a socket; returns True if it was the user's last one"""
+        self.unsubscribe_presence(websocket)
+        self._socket_users.pop(websocket, None)
+        self._closing.discard(websocket)
+
+        sockets = self._connections.get(user_id)
+        if not sockets:
+            return False
+        sockets.discard(websocket)
+        if sockets:
+            return False
+        del self._connections[user_id]
+        return True
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self._connections
+
+    def connected_user_ids(self) -> list:
+        return list(self._connections)
+
+    def subscribe_presence(self, websocket: WebSocket, user_ids: Iterable[str]):
+        """Replace a socket's presence subscriptions with the given user ids, minus hidden ones"""
+        self.unsubscribe_presence(websocket)
+        viewer_id = self._socket_users.get(websocket)
+        watched = {user_id for user_id in user_ids if can_see_presence(viewer_id, user_id)}
+        self._subscriptions[websocket] = watched
+        for user_id in watched:
+            self._presence_subscribers.setdefault(user_id, set()).add(websocket)
+
+    def unsubscribe_presence(self, websocket: WebSocket):
+        for watched_id in self._subscriptions.pop(websocket, set()):
+            subscribers = self._presence_subscribers.get(watched_id)
+            if subscribers:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self._presence_subscribers[watched_id]
+
+    async def _send_one(self, websocket: WebSocket, payload: dict) -> bool:
+        try:
+            await asyncio.wait_for(websocket.send_json(payload), timeout=WS_SEND_TIMEOUT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            # A client that stopped reading must not stall the publisher or the bus tail
+            self.slow_sockets_dropped += 1
+            self._closing.add(websocket)
+            task = asyncio.create_task(self._close_slow(websocket))
+            self._close_tasks.add(task)
+            task.add_done_callback(self._close_tasks.discard)
+        except Exception as e:
+            # The receive loop notices the broken socket and unregisters it
+            logger.debug(f"WebSocket send failed: {str(e)}")
+        return False
+
+    async def _close_slow(self, websocket: WebSocket):
+        """Close a socket that timed out; its receive loop then unregisters it as usual"""
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=WS_SEND_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.debug(f"Closing slow WebSocket failed: {str(e)}")
+
+    async def _send(self, websockets: Iterable[WebSocket], payload: dict) -> int:
+        """Send to every socket concurrently; each gets at most WS_SEND_TIMEOUT_SECONDS"""
+        targets = [websocket for websocket in websockets if websocket not in self._closing]
+        if not targets:
+            return 0
+        results = await asyncio.gather(*(self._send_one(websocket, payload) for websocket in targets))
+        sent = sum(results)
+        self.events_sent += sent
+        return sent
+
+    async def send_to_user(self, user_id: str, payload: dict) -> int:
+        return await self._send(self._connections.get(user_id, ()), payload)
+
+    async def send_to_presence_subscribers(self, user_id: str, payload: dict) -> int:
+        # Re-checked on every push: a block may have landed after the subscription
+        subscribers = [
+            websocket for websocket in self._presence_subscribers.get(user_id, ())
+            if can_see_presence(self._socket_users.get(websocket), user_id)
+        ]
+        return await self._send(subscribers, payload)
+
+    def stats(self) -> dict:
+        return {
+            "connected_users": len(self._connections),
+            "connections": sum(len(s) for s in self._connections.values()),
+            "presence_subscriptions": sum(len(s) for s in self._subscriptions.values()),
+            "events_sent": self.events_sent,
+            "slow_sockets_dropped": self.slow_sockets_dropped
+        }
+
+class SocketRegistry:
+    """Which workers hold sockets for which users, shared through the ws_connections collection.
+
+    A user only goes offline when the last socket on the last worker closes.
+    With the in-memory event bus there is a single process, so the local
+    ConnectionManager is authoritative and the database is never touched.
+    Registrations of a crashed worker stop being refreshed and expire.
+    """
+
+    def __init__(self, db, manager: ConnectionManager, enabled: bool):
+        self._collection = db.ws_connections
+        self._manager = manager
+        self.enabled = enabled
+        self.worker_id = str(uuid.uuid4())
+        self._task: Optional[asyncio.Task] = None
+
+    def _stale_before(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=3 * WS_REGISTRY_HEARTBEAT_SECONDS)
+
+    async def register(self, user_id: str):
+        """This worker now holds a socket for the user"""
+        if not self.enabled:
+            return
+        await self._collection.update_one(
+            {"_id": f"{self.worker_id}:{user_id}"},
+            {"$set": {"user_id": user_id, "worker_id": self.worker_id, "seen_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def unregister(self, user_id: str) -> bool:
+        """This worker holds no more sockets for the user; returns True if no other worker does"""
+        if not self.enabled:
+            return True
+        await self._collection.delete_one({"_id": f"{self.worker_id}:{user_id}"})
+        elsewhere = await self._collection.find_one(
+            {"user_id": user_id, "seen_at": {"$gte": self._stale_before()}},
+            {"_id": 1}
+        )
+        return elsewhere is None
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_REGISTRY_HEARTBEAT_SECONDS)
+            try:
+                # Re-upsert from local state, which also repairs registrations lost to races
+                now = datetime.utcnow()
+                operations = [
+                    UpdateOne(
+                        {"_id": f"{self.worker_id}:{user_id}"},
+                        {"$set": {"user_id": user_id, "worker_id": self.worker_id, "seen_at": now}},
+                        upsert=True
+                    )
+                    for user_id in self._manager.connected_user_ids()
+                ]
+                if operations:
+                    await self._collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"Socket registry heartbeat failed: {str(e)}")
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self._collection.delete_many({"worker_id": self.worker_id})
+
+manager = ConnectionManager()
+event_bus = create_event_bus(db)
+socket_registry = SocketRegistry(db, manager, enabled=event_bus.backend != "memory")
+
+def _event(event_type: str, data: dict) -> dict:
+    return jsonable_encoder({"type": event_type, "data": data, "sent_at": datetime.utcnow()})
+
+async def publish_to_users(user_ids: Iterable[str], event_type: str, data: dict):
+    """Push an event to every socket of each given user, on whichever worker holds it"""
+    await event_bus.publish(event_type, {
+        "user_ids": list(set(user_ids)),
+        "payload": _event(event_type, data)
+    })
+
+async def publish_presence(user_id: str, status: str, last_active: datetime):
+    """Push a presence change to everyone subscribed to this user"""
+    await event_bus.publish("presence", {
+        "presence_of": user_id,
+        "payload": _event("presence", {"user_id": user_id, "status": status, "last_active": last_active})
+    })
+
+async def _deliver_event(channel: str, message: dict):
+    """Event bus consumer: hand an event to the matching sockets on this worker"""
+    for listener in _bus_listeners.get(channel, []):
+        await listener(message)
+    if "presence_of" in message:
+        await manager.send_to_presence_subscribers(message["presence_of"], message["payload"])
+    for user_id in message.get("user_ids", []):
+        await manager.send_to_user(user_id, message["payload"])
+
+event_bus.subscribe(_deliver_event)
+
+@on_bus_event(SESSION_CACHE_CHANNEL)
+async def sync_session_cache(message: dict):
+    apply_session_invalidation(message)
+
+async def _notify_connection_change(user_id: str, is_online: bool):
+    for handler in _connection_handlers:
+        try:
+            await handler(user_id, is_online)
+        except Exception as e:
+            logger.error(f"Connection handler failed: {str(e)}")
+
+async def _authenticate(websocket: WebSocket) -> Optional[dict]:
+    """Resolve the user from a Bearer header or, for browsers, a first {"type": "auth"} frame"""
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        return await resolve_session_user(authorization.replace("Bearer ", ""), required=False)
+
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), timeout=WS_AUTH_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get("type") != "auth" or not message.get("token"):
+        return None
+    return await resolve_session_user(message["token"], required=False)
+
+@realtime_router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Authenticated event stream.
+
+    Browsers cannot set headers on a WebSocket, so they send
+    {"type": "auth", "token": ...} as the first frame; an Authorization:
+    Bearer header also works. The token never goes in the URL, where it
+    would end up in access logs. The server answers {"type": "ready"}.
+
+    Client -> server events: {"type": "ping"},
+    {"type": "subscribe_presence", "user_ids": [...]}, plus any type a feature
+    module registered with on_client_event (e.g. "typing").
+    """
+    await websocket.accept()
+    try:
+        user = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if not user:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.send_json({"type": "ready"})
+    if manager.connect(user["id"], websocket):
+        await socket_registry.register(user["id"])
+        await _notify_connection_change(user["id"], True)
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            event_type = message.get("type") if isinstance(message, dict) else None
+
+            if event_type == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif event_type == "subscribe_presence":
+                manager.subscribe_presence(websocket, message.get("user_ids", [])[:500])
+            elif event_type in _client_event_handlers:
+                await _client_event_handlers[event_type](user, message)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"WebSocket closed for user {user['id']}: {str(e)}")
+    finally:
+        if manager.disconnect(user["id"], websocket):
+            held_elsewhere = not await socket_registry.unregister(user["id"])
+            # The user may have reconnected to this worker while we were unregistering
+            if not held_elsewhere and not manager.is_connected(user["id"]):
+                await _notify_connection_change(user["id"], False)
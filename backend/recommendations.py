@@ -0,0 +1,275 @@
+"""
+Recommendation snapshots for XelaConnect discover
+A background job materializes each active user's top matches into the recommendations collection,
+so /api/discover reads one document instead of ranking on every request
+
+Invalidation bumps a snapshot's version and drops its items. Snapshots are only written if the
+version is still the one read before computing, so a snapshot computed before an invalidation
+(e.g. a connection request) can never overwrite it. The job runs on one worker at a time, the
+holder of a lease in job_locks.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from auth import db
+from blocklist import block_list
+from interest_matrix import interest_matrix
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_REFRESH_SECONDS = float(os.getenv("RECOMMENDATION_REFRESH_SECONDS", "900"))
+# Only users active within this window get a snapshot from the background job
+RECOMMENDATION_ACTIVE_DAYS = int(os.getenv("RECOMMENDATION_ACTIVE_DAYS", "14"))
+RECOMMENDATION_SNAPSHOT_SIZE = int(os.getenv("RECOMMENDATION_SNAPSHOT_SIZE", "50"))
+RECOMMENDATION_WRITE_BATCH = 500
+# The refresh job's lease; renewed after every batch, so it only has to outlast one batch
+RECOMMENDATION_LEASE_SECONDS = float(os.getenv("RECOMMENDATION_LEASE_SECONDS", "300"))
+DUPLICATE_KEY = 11000
+# Recently active users considered for the popularity fallback, per missing slot
+DISCOVER_FALLBACK_POOL = 5
+
+async def get_connected_ids(user_id: str) -> set:
+    """Everyone with a connection to or from this user, whatever its status"""
+    connections = await db.connections.find(
+        {"$or": [{"user_id": user_id}, {"connected_user_id": user_id}]},
+        {"_id": 0, "user_id": 1, "connected_user_id": 1}
+    ).to_list(None)
+
+    connected = set()
+    for conn in connections:
+        connected.add(conn["connected_user_id"] if conn["user_id"] == user_id else conn["user_id"])
+    return connected
+
+async def get_discover_fallback(excluded: list, needed: int) -> list:
+    """Most-connected users among the most recently active, as (user_id, 0) matches"""
+    pool = needed * DISCOVER_FALLBACK_POOL
+    recent = await db.users.find(
+        {"id": {"$nin": excluded}, "is_guest": False},
+        {"_id": 0, "id": 1, "connections_count": 1}
+    ).sort([("last_active", -1), ("id", -1)]).limit(pool).to_list(pool)
+
+    recent.sort(key=lambda u: u.get("connections_count", 0), reverse=True)
+    return [(u["id"], 0) for u in recent[:needed]]
+
+async def compute_recommendations(user_id: str, interests: Iterable[str]) -> dict:
+    """Rank matches for one user, excluding connections and blocks, as a snapshot document"""
+    interests = set(interests or [])
+    excluded = [user_id, *block_list.hidden_from(user_id), *await get_connected_ids(user_id)]
+    matches = interest_matrix.top_matches(interests, exclude=excluded, k=RECOMMENDATION_SNAPSHOT_SIZE)
+
+    # Not enough shared interests: fill up with popular, recently active users
+    if len(matches) < RECOMMENDATION_SNAPSHOT_SIZE:
+        matches += await get_discover_fallback(
+            excluded + [other_id for other_id, _ in matches],
+            RECOMMENDATION_SNAPSHOT_SIZE - len(matches)
+        )
+
+    return {
+        "user_id": user_id,
+        "items": [
+            {
+                "user_id": other_id,
+                "shared": shared,
+                "common_interests": list(interests & interest_matrix.interests_of(other_id))
+            }
+            for other_id, shared in matches
+        ],
+        "computed_at": datetime.utcnow()
+    }
+
+def write_snapshot(snapshot: dict, version: int) -> UpdateOne:
+    """Store a snapshot only if it has not been invalidated since version was read.
+
+    A version of 0 means no invalidation was seen, i.e. the document was missing
+    or predates versioning. When the filter does not match, the upsert collides
+    with the unique user_id index and the write is dropped as stale.
+    """
+    return UpdateOne(
+        {"user_id": snapshot["user_id"], "version": version if version else {"$in": [0, None]}},
+        {"$set": {**snapshot, "version": version}},
+        upsert=True
+    )
+
+async def get_snapshot_versions(user_ids: List[str]) -> Dict[str, int]:
+    """Current snapshot version per user, read before computing their snapshots"""
+    docs = await db.recommendations.find(
+        {"user_id": {"$in": user_ids}},
+        {"_id": 0, "user_id": 1, "version": 1}
+    ).to_list(len(user_ids))
+    return {doc["user_id"]: doc.get("version") or 0 for doc in docs}
+
+async def get_recommendations(user: dict) -> dict:
+    """Serve the stored snapshot, computing and storing it on demand when missing or invalidated"""
+    snapshot = await db.recommendations.find_one({"user_id": user["id"]}, {"_id": 0})
+    if snapshot and "items" in snapshot:
+        recommendation_refresher.snapshot_hits += 1
+        return snapshot
+
+    recommendation_refresher.on_demand += 1
+    version = (snapshot or {}).get("version") or 0
+    fresh = await compute_recommendations(user["id"], user.get("interests", []))
+    try:
+        await db.recommendations.bulk_write([write_snapshot(fresh, version)])
+    except BulkWriteError as e:
+        # Invalidated again while computing; serve this one, the next request recomputes
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+    return {**fresh, "version": version}
+
+async def invalidate_recommendations(*user_ids: str):
+    """Mark snapshots stale so the next discover request recomputes them"""
+    await db.recommendations.bulk_write([
+        UpdateOne(
+            {"user_id": user_id},
+            {"$inc": {"version": 1}, "$unset": {"items": "", "computed_at": ""}},
+            upsert=True
+        )
+        for user_id in set(user_ids)
+    ], ordered=False)
+
+class JobLease:
+    """A lease on a job_locks document, so a periodic job runs on one worker at a time.
+
+    The lease expires unless renewed, so a crashed holder is replaced once it
+    lapses. Expiry compares worker clocks, so the lease must be much longer
+    than any expected clock skew.
+    """
+
+    def __init__(self, name: str, lease_seconds: float):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = str(uuid.uuid4())
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; False while another worker holds it"""
+        now = datetime.utcnow()
+        try:
+            await db.job_locks.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release(self):
+        await db.job_locks.delete_one({"_id": self.name, "owner": self.owner})
+
+class RecommendationRefresher:
+    """Periodically rewrites the snapshot of every recently active user"""
+
+    def __init__(self, interval: float = RECOMMENDATION_REFRESH_SECONDS):
+        self.interval = interval
+        self.lease = JobLease("recommendations", RECOMMENDATION_LEASE_SECONDS)
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.skipped_runs = 0
+        self.snapshots_written = 0
+        self.stale_snapshots = 0
+        self.snapshot_hits = 0
+        self.on_demand = 0
+        self.errors = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds: Optional[float] = None
+
+    async def refresh_all(self) -> bool:
+        """Recompute snapshots for users active within RECOMMENDATION_ACTIVE_DAYS.
+
+        Returns False without doing anything unless this worker holds the lease;
+        a run that loses the lease midway stops after its current batch.
+        """
+        if not await self.lease.acquire():
+            self.skipped_runs += 1
+            return False
+
+        started = datetime.utcnow()
+        active_since = started - timedelta(days=RECOMMENDATION_ACTIVE_DAYS)
+        cursor = db.users.find(
+            {"last_active": {"$gte": active_since}, "is_guest": False},
+            {"_id": 0, "id": 1, "interests": 1}
+        )
+
+        users: List[dict] = []
+        async for user in cursor:
+            users.append(user)
+            if len(users) >= RECOMMENDATION_WRITE_BATCH:
+                await self._refresh_batch(users)
+                users = []
+                if not await self.lease.acquire():
+                    logger.warning("Recommendation refresh lost its lease, stopping")
+                    await cursor.close()
+                    return False
+        if users:
+            await self._refresh_batch(users)
+
+        self.runs += 1
+        self.last_run_at = started
+        self.last_run_seconds = (datetime.utcnow() - started).total_seconds()
+        return True
+
+    async def _refresh_batch(self, users: List[dict]):
+        versions = await get_snapshot_versions([user["id"] for user in users])
+        batch = [
+            write_snapshot(
+                await compute_recommendations(user["id"], user.get("interests", [])),
+                versions.get(user["id"], 0)
+            )
+            for user in users
+        ]
+        try:
+            await db.recommendations.bulk_write(batch, ordered=False)
+            self.snapshots_written += len(batch)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            self.snapshots_written += len(batch) - len(errors)
+            self.stale_snapshots += len(errors)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Recommendation refresh failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Let another worker take over at its next interval
+            await self.lease.release()
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "snapshots_written": self.snapshots_written,
+            "stale_snapshots": self.stale_snapshots,
+            "snapshot_hits": self.snapshot_hits,
+            "on_demand": self.on_demand,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+            "interval_seconds": self.interval
+        }
+
+recommendation_refresher = RecommendationRefresher()
@@ -0,0 +1,80 @@
+"""
+Base class for XelaConnect's in-memory mirrors of database state
+Each mirror is rebuilt from the database at startup and on an interval, and kept
+current in between by events applied through its own mutators
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ReloadableMirror(ABC):
+    """Periodic full reloads that keep the changes applied while one runs.
+
+    A reload's cursor may read a document before an event changing it
+    arrives. Mutators call _record() with each change; load() replays every
+    change recorded during the read onto the fresh state before swapping it
+    in, so the reload never rolls an event back.
+    """
+
+    name = "mirror"
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._load_lock = asyncio.Lock()
+        # Changes applied while a load is reading the database; None when idle
+        self._pending: Optional[List[Any]] = None
+        self.loaded = False
+
+    def _record(self, change):
+        """Keep a change for replay if a load is in progress"""
+        if self._pending is not None:
+            self._pending.append(change)
+
+    @abstractmethod
+    async def _build(self):
+        """Read the database into a fresh state, without touching the live one"""
+
+    @abstractmethod
+    def _replay(self, state, change):
+        """Apply a change recorded during the load onto the fresh state"""
+
+    @abstractmethod
+    def _swap(self, state):
+        """Replace the live state with the fresh one"""
+
+    async def load(self):
+        async with self._load_lock:
+            self._pending = []
+            try:
+                state = await self._build()
+                for change in self._pending:
+                    self._replay(state, change)
+                self._swap(state)
+                self.loaded = True
+            finally:
+                self._pending = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"{self.name} refresh failed: {str(e)}")
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,11 +1,13 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
+from pymongo import ReturnDocument
 
 from models import (
     User, UserCreate, LoginRequest, GoogleAuthRequest, AuthResponse,
@@ -13,12 +15,26 @@ from models import (
     Reflection, ReflectionCreate, ReflectionUpdate
 )
 from auth import (
-    hash_password, verify_password, create_user_session,
-    get_current_user, get_current_user_optional, get_user_from_emergent_session, delete_session, db
+    hash_password_async, verify_password_async, create_user_session,
+    get_current_user, get_current_user_optional, get_user_from_emergent_session, delete_session, db,
+    invalidate_user, session_cache, password_hash_pool, emergent_auth_breaker, require_metrics_token
 )
+from http_client import close_http_client
+from indexes import ensure_indexes, last_index_report
+from message_store import append_messages, get_recent_messages
 from messaging import messaging_router
-from presence import presence_router, safety_router
+from presence import presence_router, safety_router, presence_engine
 from video_calling import video_router
+from realtime import realtime_router, manager as realtime_manager, event_bus, socket_registry
+from typing_store import typing_store
+from blocklist import block_list
+from interest_matrix import interest_matrix, publish_interests
+from recommendations import get_recommendations, invalidate_recommendations, recommendation_refresher
+from author_cache import author_cache
+from pagination import decode_cursor, keyset_page
+from circle_catalog import circle_catalog, publish_circles_changed, CIRCLE_LIST_PROJECTION
+from circle_memberships import add_member, remove_member, is_member, get_members_page
+from messaging import get_user_summaries
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -40,6 +56,25 @@ async def root():
     """Test endpoint"""
     return {"message": "XelaConnect API is running!", "version": "1.0.0"}
 
+@api_router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    """In-process counters for monitoring; needs the X-Metrics-Token header"""
+    return {
+        "session_cache": session_cache.stats(),
+        "password_hashing": password_hash_pool.stats(),
+        "circuit_breakers": {"emergent_auth": emergent_auth_breaker.stats()},
+        "indexes": last_index_report,
+        "realtime": realtime_manager.stats(),
+        "event_bus": event_bus.stats(),
+        "typing_indicators": typing_store.stats(),
+        "presence": presence_engine.stats(),
+        "block_list": block_list.stats(),
+        "interest_matrix": interest_matrix.stats(),
+        "recommendations": recommendation_refresher.stats(),
+        "author_cache": author_cache.stats(),
+        "circle_catalog": circle_catalog.stats()
+    }
+
 @api_router.post("/auth/signup", response_model=AuthResponse)
 async def signup(user_data: UserCreate):
     """Sign up with email and password"""
@@ -52,9 +87,10 @@ async def signup(user_data: UserCreate):
     user_dict = user_data.dict(exclude={"password"})
     user = User(**user_dict)
     user_dict_with_id = user.dict()
-    user_dict_with_id["password_hash"] = hash_password(user_data.password)
+    user_dict_with_id["password_hash"] = await hash_password_async(user_data.password)
     
     await db.users.insert_one(user_dict_with_id)
+    await publish_interests(user.id, user.interests)
     
     # Create session
     session_token = await create_user_session(user.id)
@@ -73,14 +109,11 @@ async def login(login_data: LoginRequest):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Verify password
-    if not verify_password(login_data.password, user_doc.get("password_hash", "")):
+    if not await verify_password_async(login_data.password, user_doc.get("password_hash", "")):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Update last active
-    await db.users.update_one(
-        {"email": login_data.email},
-        {"$set": {"last_active": datetime.utcnow()}}
-    )
+    presence_engine.touch(user_doc["id"])
     
     # Create session
     session_token = await create_user_session(user_doc["id"])
@@ -113,14 +146,12 @@ async def google_auth(auth_data: GoogleAuthRequest):
         )
         user_dict = user.dict()
         await db.users.insert_one(user_dict)
+        await publish_interests(user.id, user.interests)
         user_id = user.id
     else:
         user_id = user_doc["id"]
         # Update last active
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"last_active": datetime.utcnow()}}
-        )
+        presence_engine.touch(user_id)
         if "_id" in user_doc:
             del user_doc["_id"]
         user = User(**user_doc)
@@ -136,7 +167,7 @@ async def get_me(user = Depends(get_current_user)):
     return {"user": user}
 
 @api_router.post("/auth/logout")
-async def logout(authorization: str = Depends(lambda x: x)):
+async def logout(authorization: str = Header(None)):
     """Logout user"""
     if authorization and authorization.startswith("Bearer "):
         session_token = authorization.replace("Bearer ", "")
@@ -183,6 +214,11 @@ async def update_profile(profile_data: dict, user = Depends(get_current_user)):
             {"id": user["id"]},
             {"$set": update_data}
         )
+        await invalidate_user(user["id"])
+        author_cache.invalidate(user["id"])
+        if "interests" in update_data:
+            await publish_interests(user["id"], update_data["interests"])
+            await invalidate_recommendations(user["id"])
     
     # Get updated user
     updated_user = await db.users.find_one({"id": user["id"]})
@@ -213,57 +249,41 @@ async def get_referral_data(user = Depends(get_current_user)):
 # ==================== CIRCLES/COMMUNITY ENDPOINTS ====================
 
 @api_router.get("/circles")
-async def get_circles(category: str = None):
-    """Get all circles with optional category filter"""
-    query = {}
-    if category and category != "All":
-        query["category"] = category
-    
-    circles = await db.circles.find(query).to_list(1000)
-    
-    # Clean _id from response
-    for circle in circles:
-        if "_id" in circle:
-            del circle["_id"]
+async def get_circles(request: Request, category: str = None):
+    """Get all circles with optional category filter (cached, ETag / If-None-Match aware)"""
+    if category == "All":
+        category = None
     
-    return {"circles": circles}
+    return await circle_catalog.respond(request, category)
 
 @api_router.get("/circles/{circle_id}")
 async def get_circle_detail(circle_id: str, user = Depends(get_current_user)):
     """Get circle details"""
-    circle = await db.circles.find_one({"id": circle_id})
+    circle = await db.circles.find_one({"id": circle_id}, CIRCLE_LIST_PROJECTION)
     
     if not circle:
         raise HTTPException(status_code=404, detail="Circle not found")
     
-    if "_id" in circle:
-        del circle["_id"]
-    
-    is_member = user["id"] in circle.get("members", [])
-    
     return {
         "circle": circle,
-        "is_member": is_member,
+        "is_member": await is_member(circle_id, user["id"]),
         "recent_activity": circle.get("recent_activity", [])
     }
 
 @api_router.post("/circles/{circle_id}/join")
 async def join_circle(circle_id: str, user = Depends(get_current_user_optional)):
     """Join a circle"""
-    circle = await db.circles.find_one({"id": circle_id})
+    circle = await db.circles.find_one({"id": circle_id}, {"_id": 0, "id": 1})
     
     if not circle:
         raise HTTPException(status_code=404, detail="Circle not found")
     
     # For demo purposes, allow joining without auth (mock user scenario)
-    if user:
-        # Add user to circle members
+    if user and await add_member(circle_id, user["id"]):
+        # Only a new membership moves the count
         await db.circles.update_one(
             {"id": circle_id},
-            {
-                "$addToSet": {"members": user["id"]},
-                "$inc": {"members_count": 1}
-            }
+            {"$inc": {"members_count": 1}}
         )
         
         # Add circle to user's joined circles
@@ -271,35 +291,56 @@ async def join_circle(circle_id: str, user = Depends(get_current_user_optional))
             {"id": user["id"]},
             {"$addToSet": {"circles_joined": circle_id}}
         )
+        await invalidate_user(user["id"])
+        await publish_circles_changed()
     
     # Get updated circle
-    updated_circle = await db.circles.find_one({"id": circle_id})
-    if "_id" in updated_circle:
-        del updated_circle["_id"]
+    updated_circle = await db.circles.find_one({"id": circle_id}, CIRCLE_LIST_PROJECTION)
     
     return {"message": "Successfully joined circle", "circle": updated_circle}
 
 @api_router.post("/circles/{circle_id}/leave")
 async def leave_circle(circle_id: str, user = Depends(get_current_user_optional)):
     """Leave a circle"""
-    if user:
-        # Remove user from circle members
+    if user and await remove_member(circle_id, user["id"]):
         await db.circles.update_one(
             {"id": circle_id},
-            {
-                "$pull": {"members": user["id"]},
-                "$inc": {"members_count": -1}
-            }
+            {"$inc": {"members_count": -1}}
         )
         
         # Remove circle from user's joined circles
         await db.users.update_one(
-        {"id": user["id"]},
-        {"$pull": {"circles_joined": circle_id}}
-    )
+            {"id": user["id"]},
+            {"$pull": {"circles_joined": circle_id}}
+        )
+        await invalidate_user(user["id"])
+        await publish_circles_changed()
     
     return {"message": "Successfully left circle"}
 
+@api_router.get("/circles/{circle_id}/members")
+async def get_circle_members(
+    circle_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    user = Depends(get_current_user)
+):
+    """Get a circle's members, most recently joined first (keyset pagination on joined_at, user_id)"""
+    memberships, next_cursor = await get_members_page(circle_id, before=decode_cursor(cursor), limit=limit)
+    
+    summaries = await get_user_summaries(m["user_id"] for m in memberships)
+    members = [
+        {"user": summaries[m["user_id"]], "joined_at": m["joined_at"]}
+        for m in memberships
+        if m["user_id"] in summaries
+    ]
+    
+    return {
+        "members": members,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
+
 # ==================== COURSES ENDPOINTS ====================
 
 @api_router.get("/courses")
@@ -375,6 +416,7 @@ async def enroll_course(course_id: str, user = Depends(get_current_user)):
             }
         }
     )
+    await invalidate_user(user["id"])
     
     return {"message": "Enrolled successfully", "enrolled": True}
 
@@ -491,6 +533,7 @@ async def mark_lesson_complete(course_id: str, lesson_id: str, user = Depends(ge
                 "$set": {"courses_progress.$.progress": new_progress}
             }
         )
+        await invalidate_user(user["id"])
         
         return {
             "message": "Lesson marked as complete",
@@ -505,8 +548,6 @@ async def mark_lesson_complete(course_id: str, lesson_id: str, user = Depends(ge
 @api_router.post("/reflections")
 async def create_reflection(reflection_data: ReflectionCreate, user = Depends(get_current_user)):
     """Create a new reflection"""
-    from datetime import timezone
-    
     reflection = Reflection(
         user_id=user["id"],
         prompt=reflection_data.prompt,
@@ -525,31 +566,109 @@ async def create_reflection(reflection_data: ReflectionCreate, user = Depends(ge
     
     return reflection_dict
 
+REFLECTION_PREVIEW_CHARS = 200
+# Journal list rows: the full text comes from GET /reflections/{reflection_id}
+REFLECTION_LIST_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "prompt": 1,
+    "preview": {"$substrCP": ["$content", 0, REFLECTION_PREVIEW_CHARS]},
+    "is_public": 1,
+    "created_at": 1
+}
+
 @api_router.get("/reflections")
-async def get_user_reflections(user = Depends(get_current_user)):
-    """Get all reflections for the current user"""
-    reflections = await db.reflections.find(
+async def get_user_reflections(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    user = Depends(get_current_user)
+):
+    """Get the current user's reflections, newest first (keyset pagination on created_at, id)"""
+    # user_id_created_at_id index
+    reflections, next_cursor = await keyset_page(
+        db.reflections,
         {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+        REFLECTION_LIST_PROJECTION,
+        decode_cursor(cursor),
+        limit,
+        "created_at"
+    )
     
-    return {"reflections": reflections}
+    return {
+        "reflections": reflections,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
 
 @api_router.get("/reflections/public")
-async def get_public_reflections(limit: int = 50):
-    """Get public reflections from all users"""
-    reflections = await db.reflections.find(
+async def get_public_reflections(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100)
+):
+    """Get public reflections from all users, newest first (keyset pagination on created_at, id)"""
+    # is_public_created_at_id index
+    reflections, next_cursor = await keyset_page(
+        db.reflections,
         {"is_public": True},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        {"_id": 0},
+        decode_cursor(cursor),
+        limit,
+        "created_at"
+    )
     
-    # Get user info for each reflection
+    # Resolve every author at once, mostly from cache
+    authors = await author_cache.get_many(r["user_id"] for r in reflections)
     for reflection in reflections:
-        user = await db.users.find_one({"id": reflection["user_id"]}, {"_id": 0, "name": 1, "picture": 1})
-        if user:
-            reflection["user"] = user
+        if reflection["user_id"] in authors:
+            reflection["user"] = authors[reflection["user_id"]]
     
-    return {"reflections": reflections}
+    return {
+        "reflections": reflections,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
+
+# Relevance-ranked results cannot be keyset-paginated, so offsets are bounded instead
+MAX_SEARCH_OFFSET = 500
+
+@api_router.get("/reflections/search")
+async def search_reflections(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("mine", pattern="^(mine|public)$"),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    limit: int = Query(20, ge=1, le=50),
+    user = Depends(get_current_user)
+):
+    """Search your own or public reflections by prompt and content, best match first"""
+    query = {"$text": {"$search": q}}
+    if scope == "mine":
+        query["user_id"] = user["id"]
+    else:
+        query["is_public"] = True
+    
+    # The text index resolves matches; only the requested page is ranked out and returned
+    reflections = await db.reflections.find(
+        query,
+        {"_id": 0, "score": {"$meta": "textScore"}}
+    ).sort([
+        ("score", {"$meta": "textScore"}),
+        ("created_at", -1)
+    ]).skip(offset).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(reflections) > limit
+    reflections = reflections[:limit]
+    
+    if scope == "public":
+        authors = await author_cache.get_many(r["user_id"] for r in reflections)
+        for reflection in reflections:
+            if reflection["user_id"] in authors:
+                reflection["user"] = authors[reflection["user_id"]]
+    
+    return {
+        "reflections": reflections,
+        "has_more": has_more,
+        "next_offset": offset + limit if has_more and offset + limit <= MAX_SEARCH_OFFSET else None
+    }
 
 @api_router.get("/reflections/{reflection_id}")
 async def get_reflection(reflection_id: str, user = Depends(get_current_user)):
@@ -571,16 +690,6 @@ async def update_reflection(
     user = Depends(get_current_user)
 ):
     """Update a reflection"""
-    from datetime import timezone
-    
-    # Check if reflection exists and belongs to user
-    reflection = await db.reflections.find_one(
-        {"id": reflection_id, "user_id": user["id"]}
-    )
-    
-    if not reflection:
-        raise HTTPException(status_code=404, detail="Reflection not found")
-    
     # Build update dict
     update_data = {}
     if reflection_update.content is not None:
@@ -590,98 +699,73 @@ async def update_reflection(
     
     update_data["updated_at"] = datetime.now(timezone.utc)
     
-    # Update reflection
-    await db.reflections.update_one(
-        {"id": reflection_id},
-        {"$set": update_data}
+    # Ownership check, update and read-back in one atomic round trip
+    updated_reflection = await db.reflections.find_one_and_update(
+        {"id": reflection_id, "user_id": user["id"]},
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    # Get updated reflection
-    updated_reflection = await db.reflections.find_one(
-        {"id": reflection_id},
-        {"_id": 0}
-    )
+    if not updated_reflection:
+        raise HTTPException(status_code=404, detail="Reflection not found")
     
     return updated_reflection
 
 @api_router.delete("/reflections/{reflection_id}")
 async def delete_reflection(reflection_id: str, user = Depends(get_current_user)):
     """Delete a reflection"""
-    # Check if reflection exists and belongs to user
-    reflection = await db.reflections.find_one(
-        {"id": reflection_id, "user_id": user["id"]}
+    # Ownership check and delete in one atomic round trip
+    reflection = await db.reflections.find_one_and_delete(
+        {"id": reflection_id, "user_id": user["id"]},
+        projection={"_id": 0, "id": 1}
     )
     
     if not reflection:
         raise HTTPException(status_code=404, detail="Reflection not found")
     
-    # Delete reflection
-    await db.reflections.delete_one({"id": reflection_id})
-    
     return {"message": "Reflection deleted successfully"}
 
 
-# Include all routers in the main app
-app.include_router(api_router)
-app.include_router(messaging_router, prefix="/api")
-app.include_router(presence_router, prefix="/api")
-app.include_router(safety_router, prefix="/api")
-app.include_router(video_router, prefix="/api")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    from motor.motor_asyncio import AsyncIOMotorClient
-    mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
-    client.close()
-
 # ==================== DISCOVER/MATCHING ENDPOINTS ====================
 
+DISCOVER_LIMIT = 10
+
 @api_router.get("/discover")
 async def get_discover_people(user = Depends(get_current_user)):
     """Get friend recommendations"""
-    # Get all users except current user
-    all_users = await db.users.find({
-        "id": {"$ne": user["id"]},
-        "is_guest": False
-    }).to_list(100)
+    # Serve the precomputed snapshot; blocks made since it was computed are filtered here
+    snapshot = await get_recommendations(user)
+    hidden = block_list.hidden_from(user["id"])
+    items = [item for item in snapshot["items"] if item["user_id"] not in hidden][:DISCOVER_LIMIT]
+    
+    match_ids = [item["user_id"] for item in items]
+    users = await db.users.find(
+        {"id": {"$in": match_ids}},
+        {"_id": 0, "password_hash": 0}
+    ).to_list(len(match_ids))
+    users_by_id = {u["id"]: u for u in users}
     
-    # Calculate compatibility (simple matching based on interests)
-    recommendations = []
     user_interests = set(user.get("interests", []))
-    
-    for other_user in all_users:
-        other_interests = set(other_user.get("interests", []))
-        common_interests = user_interests.intersection(other_interests)
+    recommendations = []
+    for item in items:
+        other_user = users_by_id.get(item["user_id"])
+        if not other_user:
+            continue
         
-        if common_interests:
-            compatibility_score = int((len(common_interests) / max(len(user_interests), 1)) * 100)
+        shared = item["shared"]
+        if shared:
+            compatibility_score = int((shared / max(len(user_interests), 1)) * 100)
         else:
             compatibility_score = 50  # Base score
         
-        if "_id" in other_user:
-            del other_user["_id"]
-        if "password_hash" in other_user:
-            del other_user["password_hash"]
-        
         recommendations.append({
             "user": other_user,
             "compatibility_score": min(compatibility_score, 95),
-            "common_interests": list(common_interests)
+            "common_interests": item["common_interests"]
         })
     
-    # Sort by compatibility
-    recommendations.sort(key=lambda x: x["compatibility_score"], reverse=True)
-    
-    return {"people": recommendations[:10]}
+    return {"people": recommendations}
 
 @api_router.post("/connections/request")
 async def send_connection_request(request_data: dict, user = Depends(get_current_user)):
@@ -711,6 +795,7 @@ async def send_connection_request(request_data: dict, user = Depends(get_current
     )
     
     await db.connections.insert_one(connection.dict())
+    await invalidate_recommendations(user["id"], target_user_id)
     
     return {"message": "Connection request sent", "connection": connection.dict()}
 
@@ -745,6 +830,9 @@ async def accept_connection(connection_id: str, user = Depends(get_current_user)
         {"id": connection["connected_user_id"]},
         {"$inc": {"connections_count": 1}}
     )
+    await invalidate_user(connection["user_id"])
+    await invalidate_user(connection["connected_user_id"])
+    await invalidate_recommendations(connection["user_id"], connection["connected_user_id"])
     
     updated_connection = await db.connections.find_one({"id": connection_id})
     if "_id" in updated_connection:
@@ -813,19 +901,21 @@ async def get_xelatalks_conversation(user = Depends(get_current_user)):
     conversation = await db.conversations.find_one({
         "user_id": user["id"],
         "type": "ai"
-    })
+    }, {"messages": 0})
     
     if not conversation:
         # Create new conversation
         conversation = Conversation(
             user_id=user["id"],
             type="ai"
-        )
-        await db.conversations.insert_one(conversation.dict())
+        ).dict(exclude={"messages"})
+        await db.conversations.insert_one(conversation)
     
     if "_id" in conversation:
         del conversation["_id"]
     
+    conversation["messages"] = await get_recent_messages(conversation["id"])
+    
     return {"conversation": conversation}
 
 @api_router.post("/xelatalks/message")
@@ -840,13 +930,13 @@ async def send_xelatalks_message(message_data: dict, user = Depends(get_current_
     conversation = await db.conversations.find_one({
         "user_id": user["id"],
         "type": "ai"
-    })
+    }, {"_id": 0, "id": 1})
     
     if not conversation:
         conversation = Conversation(
             user_id=user["id"],
             type="ai"
-        ).dict()
+        ).dict(exclude={"messages"})
         await db.conversations.insert_one(conversation)
     
     # Add user message
@@ -859,7 +949,7 @@ async def send_xelatalks_message(message_data: dict, user = Depends(get_current_
     # Get AI response
     ai_response_text = await get_ai_response(
         user_message,
-        conversation.get("messages", []),
+        await get_recent_messages(conversation["id"], limit=20),
         user["id"]
     )
     
@@ -871,15 +961,14 @@ async def send_xelatalks_message(message_data: dict, user = Depends(get_current_
     )
     
     # Update conversation
+    await append_messages(conversation["id"], [user_msg.dict(), ai_msg.dict()])
     await db.conversations.update_one(
-        {"user_id": user["id"], "type": "ai"},
+        {"id": conversation["id"]},
         {
-            "$push": {
-                "messages": {
-                    "$each": [user_msg.dict(), ai_msg.dict()]
-                }
-            },
-            "$set": {"last_message_at": datetime.utcnow()}
+            "$set": {
+                "last_message_at": ai_msg.timestamp,
+                "last_message": ai_msg.dict()
+            }
         }
     )
     
@@ -937,3 +1026,61 @@ async def mark_activity_read(activity_id: str, user = Depends(get_current_user))
     )
     
     return {"message": "Activity marked as read"}
+
+
+# Include all routers in the main app
+app.include_router(api_router)
+app.include_router(messaging_router, prefix="/api")
+app.include_router(presence_router, prefix="/api")
+app.include_router(safety_router, prefix="/api")
+app.include_router(video_router, prefix="/api")
+app.include_router(realtime_router, prefix="/api")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.on_event("startup")
+async def startup_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def startup_event_bus():
+    await event_bus.start()
+    await socket_registry.start()
+
+@app.on_event("startup")
+async def startup_presence_engine():
+    await presence_engine.start()
+
+@app.on_event("startup")
+async def startup_block_list():
+    await block_list.start()
+
+@app.on_event("startup")
+async def startup_interest_matrix():
+    await interest_matrix.start()
+
+@app.on_event("startup")
+async def startup_recommendations():
+    # Needs the interest matrix and block list loaded first
+    await recommendation_refresher.start()
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    password_hash_pool.shutdown()
+    await socket_registry.stop()
+    await event_bus.stop()
+    await presence_engine.stop()
+    await block_list.stop()
+    await recommendation_refresher.stop()
+    await interest_matrix.stop()
+    await close_http_client()
+    from motor.motor_asyncio import AsyncIOMotorClient
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    client.close()
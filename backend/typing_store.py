@@ -0,0 +1,66 @@
+"""
+Ephemeral typing indicator store for XelaConnect
+In-memory (user, target) -> expiry map; entries expire via a min-heap, never touching the database
+"""
+import heapq
+import os
+import time
+from typing import Dict, List, Tuple
+
+TYPING_TTL_SECONDS = float(os.getenv("TYPING_TTL_SECONDS", "5"))
+
+class TypingStore:
+    """Expiring typing indicators keyed by (user_id, typing_to)"""
+
+    def __init__(self, ttl: float = TYPING_TTL_SECONDS):
+        self.ttl = ttl
+        self.throttled = 0
+        self._expires_at: Dict[Tuple[str, str], float] = {}
+        # (expires_at, key); superseded entries are skipped when popped
+        self._heap: List[Tuple[float, Tuple[str, str]]] = []
+
+    def set(self, user_id: str, typing_to: str, is_typing: bool):
+        self._expire()
+        key = (user_id, typing_to)
+        if not is_typing:
+            self._expires_at.pop(key, None)
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        self._expires_at[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def is_typing(self, user_id: str, typing_to: str) -> bool:
+        self._expire()
+        return (user_id, typing_to) in self._expires_at
+
+    def should_publish(self, user_id: str, typing_to: str, is_typing: bool) -> bool:
+        """Whether an indicator would change what other workers show.
+
+        Repeats of "typing" are only re-published once the current entry is
+        past half its TTL, which keeps every worker's copy alive while
+        bounding bus writes to two per TTL per (user, target). A "stopped"
+        for an entry that already expired changes nothing.
+        """
+        self._expire()
+        expires_at = self._expires_at.get((user_id, typing_to))
+        if is_typing:
+            publish = expires_at is None or expires_at - time.monotonic() <= self.ttl / 2
+        else:
+            publish = expires_at is not None
+        if not publish:
+            self.throttled += 1
+        return publish
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expires_at.get(key) == expires_at:
+                del self._expires_at[key]
+
+    def stats(self) -> dict:
+        self._expire()
+        return {"active": len(self._expires_at), "heap_size": len(self._heap), "throttled": self.throttled}
+
+typing_store = TypingStore()
@@ -23,9 +23,44 @@ const Chat = () => {
 
   useEffect(() => {
     fetchConversation();
-    // Poll for new messages every 3 seconds
-    const interval = setInterval(fetchConversation, 3000);
-    return () => clearInterval(interval);
+
+    // New messages and typing events are pushed over the WebSocket;
+    // fall back to polling every 3 seconds only while it is unavailable
+    let pollInterval = null;
+    let typingTimeout = null;
+    const startPolling = () => {
+      if (!pollInterval) pollInterval = setInterval(fetchConversation, 3000);
+    };
+
+    // The token goes in the first frame, never the URL, so it stays out of access logs
+    const socket = new WebSocket(`${BACKEND_URL.replace(/^http/, 'ws')}/api/ws`);
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('session_token') }));
+    };
+
+    socket.onmessage = (e) => {
+      const event = JSON.parse(e.data);
+      if (event.type === 'message' && event.data.message.sender_id === userId) {
+        const incoming = event.data.message;
+        setMessages((prev) =>
+          prev.some((m) => m.message_id === incoming.message_id) ? prev : [...prev, incoming]
+        );
+        setIsTyping(false);
+      } else if (event.type === 'typing' && event.data.user_id === userId) {
+        setIsTyping(event.data.is_typing);
+        clearTimeout(typingTimeout);
+        typingTimeout = setTimeout(() => setIsTyping(false), 5000);
+      }
+    };
+    socket.onclose = startPolling;
+    socket.onerror = startPolling;
+
+    return () => {
+      socket.onclose = null;
+      socket.close();
+      clearInterval(pollInterval);
+      clearTimeout(typingTimeout);
+    };
   }, [userId]);
 
   useEffect(() => {
@@ -33,9 +33,8 @@ const Messages = () => {
     }
   };
 
-  const getLastMessage = (messages) => {
-    if (!messages || messages.length === 0) return 'No messages yet';
-    const last = messages[messages.length - 1];
+  const getLastMessage = (last) => {
+    if (!last) return 'No messages yet';
     return last.content.substring(0, 50) + (last.content.length > 50 ? '...' : '');
   };
 
@@ -94,9 +93,7 @@ const Messages = () => {
               const otherUser = conversation.other_user;
               if (!otherUser) return null;
 
-              const unreadCount = conversation.messages?.filter(m => 
-                !m.read && m.sender_id !== conversation.user_id
-              ).length || 0;
+              const unreadCount = conversation.unread_count || 0;
 
               return (
                 <Card
@@ -130,7 +127,7 @@ const Messages = () => {
                         </span>
                       </div>
                       <p className="text-sm text-white/60 truncate">
-                        {getLastMessage(conversation.messages)}
+                        {getLastMessage(conversation.last_message)}
                       </p>
                     </div>
 
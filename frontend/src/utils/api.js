@@ -78,8 +78,9 @@ export const activityAPI = {
 
 export const reflectionsAPI = {
   create: (data) => api.post('/reflections', data),
-  getAll: () => api.get('/reflections'),
+  getAll: (cursor) => api.get('/reflections', { params: { cursor } }),
   getPublic: (limit) => api.get('/reflections/public', { params: { limit } }),
+  search: (q, scope = 'mine', offset = 0) => api.get('/reflections/search', { params: { q, scope, offset } }),
   getById: (id) => api.get(`/reflections/${id}`),
   update: (id, data) => api.put(`/reflections/${id}`, data),
   delete: (id) => api.delete(`/reflections/${id}`),
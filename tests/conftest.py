@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# auth.py builds its Motor client at import time; Motor connects lazily, so no server is needed
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "xelaconnect_test")
+
+TEST_MONGO_URL = os.getenv("TEST_MONGO_URL", "mongodb://localhost:27017")
+
+@pytest.fixture(scope="session")
+def mongo_url():
+    """A live mongod for tests that need real query semantics; skips the test when none answers"""
+    try:
+        MongoClient(TEST_MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod at {TEST_MONGO_URL}")
+    return TEST_MONGO_URL
+
+class PausingCursor:
+    """Yields the given users, pausing after the first until resumed"""
+
+    def __init__(self, users, paused: asyncio.Event, resume: asyncio.Event):
+        self._users = list(users)
+        self._paused = paused
+        self._resume = resume
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._users:
+            raise StopAsyncIteration
+        user = self._users.pop(0)
+        if not self._paused.is_set():
+            self._paused.set()
+            await self._resume.wait()
+        return user
+
+class PausingUsers:
+    """users collection whose find() cursor stops after the first document until resume is set"""
+
+    def __init__(self, users):
+        self.users = users
+        self.paused = asyncio.Event()
+        self.resume = asyncio.Event()
+
+    def find(self, query, projection=None):
+        return PausingCursor(self.users, self.paused, self.resume)
+
+class PausingDb:
+    def __init__(self, users):
+        self.users = PausingUsers(users)
+
+@pytest.fixture
+def pausing_db():
+    """Factory for a fake db that lets a test act while a reload is reading users"""
+    return PausingDb
@@ -0,0 +1,36 @@
+"""
+Block-list reloads keep block events that arrive while the users collection is being read
+"""
+import asyncio
+
+import pytest
+
+import blocklist
+from blocklist import BlockList
+
+@pytest.fixture
+def db(monkeypatch, pausing_db):
+    # u1 has blocked u2 in the snapshot the reload reads
+    fake = pausing_db([{"id": "u1", "blocked_users": ["u2"]}, {"id": "u3", "blocked_users": ["u4"]}])
+    monkeypatch.setattr(blocklist, "db", fake)
+    return fake
+
+def test_changes_during_a_reload_survive_the_swap(db):
+    block_list = BlockList()
+
+    async def scenario():
+        reload = asyncio.create_task(block_list.load())
+        await db.users.paused.wait()
+        # Both events arrive after the cursor read u1's document
+        block_list.apply("u1", "u2", False)
+        block_list.apply("u1", "u5", True)
+        db.users.resume.set()
+        await reload
+
+    asyncio.run(scenario())
+
+    assert block_list.blocked_ids("u1") == {"u5"}
+    assert block_list.hidden_from("u2") == set()
+    assert block_list.hidden_from("u5") == {"u1"}
+    assert block_list.is_blocked("u3", "u4")
+    assert block_list._pending is None
@@ -0,0 +1,76 @@
+"""
+Circle catalog: invalidations during a rebuild are not lost, and If-None-Match compares weakly
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import circle_catalog as circle_catalog_module
+from circle_catalog import CircleCatalog
+
+class Cursor:
+    def __init__(self, circles, before_return=None):
+        self._circles = circles
+        self._before_return = before_return
+
+    async def to_list(self, n):
+        circles = [dict(c) for c in self._circles]
+        if self._before_return:
+            await self._before_return()
+        return circles
+
+class FakeCircles:
+    def __init__(self):
+        self.circles = [{"id": "c1", "name": "Chess", "category": "Games"}]
+        self.before_return = None
+
+    def find(self, query, projection=None):
+        return Cursor(self.circles, self.before_return)
+
+class FakeDb:
+    def __init__(self):
+        self.circles = FakeCircles()
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(circle_catalog_module, "db", fake)
+    return fake
+
+def test_invalidation_during_a_build_is_not_lost(db):
+    catalog = CircleCatalog()
+
+    async def rename_midway():
+        # A membership change lands after the read, before the entry is stored
+        db.circles.circles = [{"id": "c1", "name": "Chess Club", "category": "Games"}]
+        catalog.invalidate()
+
+    async def scenario():
+        db.circles.before_return = rename_midway
+        await catalog.get(None)
+        db.circles.before_return = None
+        return await catalog.get(None)
+
+    entry = asyncio.run(scenario())
+    assert b"Chess Club" in entry["body"]
+    assert catalog.misses == 2
+
+@pytest.fixture
+def client(db):
+    catalog = CircleCatalog()
+    app = FastAPI()
+
+    @app.get("/circles")
+    async def circles(request: Request):
+        return await catalog.respond(request, None)
+
+    return TestClient(app)
+
+def test_if_none_match_uses_weak_comparison(client):
+    etag = client.get("/circles").headers["etag"]
+
+    for header in [etag, f"W/{etag}", f'"other", W/{etag}', "*"]:
+        assert client.get("/circles", headers={"If-None-Match": header}).status_code == 304
+    assert client.get("/circles", headers={"If-None-Match": '"other"'}).status_code == 200
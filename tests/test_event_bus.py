@@ -0,0 +1,116 @@
+"""
+Mongo event bus against a real mongod (TEST_MONGO_URL, default localhost);
+skipped when no server answers
+"""
+import asyncio
+import uuid
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import event_bus
+from event_bus import MongoEventBus
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, channel, message):
+        self.events.append((channel, message))
+
+async def _wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out waiting for events")
+        await asyncio.sleep(0.05)
+
+def run_with_buses(mongo_url, scenario, workers=2):
+    """Run scenario(db, buses) against a fresh capped collection"""
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f"xelaconnect_test_{uuid.uuid4().hex[:8]}"]
+        buses = [MongoEventBus(db, "realtime_events") for _ in range(workers)]
+        for bus in buses:
+            bus.subscribe(Recorder())
+        try:
+            await scenario(db, buses)
+        finally:
+            for bus in buses:
+                await bus.stop()
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
+
+def test_events_reach_other_workers_once(mongo_url, monkeypatch):
+    monkeypatch.setattr(event_bus, "EVENT_BUS_RETRY_SECONDS", 0.05)
+
+    async def scenario(db, buses):
+        a, b = buses
+        for bus in buses:
+            await bus.start()
+        for i in range(3):
+            await a.publish("message", {"n": i})
+        await _wait_for(lambda: len(b._handler.events) == 3)
+        await asyncio.sleep(0.2)
+
+        assert b._handler.events == [("message", {"n": i}) for i in range(3)]
+        assert a._handler.events == [("message", {"n": i}) for i in range(3)]
+
+    run_with_buses(mongo_url, scenario)
+
+def test_events_before_start_are_not_replayed(mongo_url, monkeypatch):
+    monkeypatch.setattr(event_bus, "EVENT_BUS_RETRY_SECONDS", 0.05)
+
+    async def scenario(db, buses):
+        a, b = buses
+        await a.start()
+        await a.publish("message", {"n": "old"})
+        await b.start()
+        await a.publish("message", {"n": "new"})
+        await _wait_for(lambda: b._handler.events)
+        await asyncio.sleep(0.2)
+
+        assert b._handler.events == [("message", {"n": "new"})]
+
+    run_with_buses(mongo_url, scenario)
+
+def event(seq: int) -> dict:
+    return {"seq": seq, "channel": "message", "message": {"n": seq}, "origin": "other", "created_at": datetime.utcnow()}
+
+def test_idle_tail_keeps_its_cursor(mongo_url, monkeypatch):
+    async def scenario(db, buses):
+        a, b = buses
+        for bus in buses:
+            await bus.start()
+        await a.publish("message", {"n": 1})
+        await _wait_for(lambda: len(b._handler.events) == 1)
+        # Several empty server-side awaits (about 1s each) must not reopen the cursor
+        await asyncio.sleep(2.5)
+        await a.publish("message", {"n": 2})
+        await _wait_for(lambda: len(b._handler.events) == 2)
+
+        assert b.reopens == 0
+
+    run_with_buses(mongo_url, scenario)
+
+def test_reopened_tail_filters_by_sequence_and_skips_delivered(mongo_url, monkeypatch):
+    monkeypatch.setattr(event_bus, "EVENT_BUS_RETRY_SECONDS", 0.05)
+
+    async def scenario(db, buses):
+        (bus,) = buses
+        await bus.start()
+        await db.realtime_events.insert_many([event(1), event(3)])
+        await _wait_for(lambda: len(bus._handler.events) == 2)
+
+        # Kill the tail; seq 2 was taken before seq 3 but lands after it
+        bus._task.cancel()
+        await asyncio.gather(bus._task, return_exceptions=True)
+        await db.realtime_events.insert_many([event(2), event(4)])
+        bus._task = asyncio.create_task(bus._tail())
+        await _wait_for(lambda: len(bus._handler.events) == 4)
+        await asyncio.sleep(0.2)
+
+        assert [message["n"] for _, message in bus._handler.events] == [1, 3, 2, 4]
+
+    run_with_buses(mongo_url, scenario, workers=1)
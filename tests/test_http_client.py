@@ -0,0 +1,114 @@
+"""
+Outbound HTTP client and Emergent auth error mapping, against an httpx mock transport
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import auth
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError, request_with_retries
+
+URL = "https://auth.test/session-data"
+
+class Upstream:
+    """Scripted upstream: replays responses in order, repeating the last one"""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def script(self, responses):
+        self.responses.extend(responses)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route the pooled client to a scripted upstream"""
+    upstream = Upstream()
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle)))
+    monkeypatch.setattr(http_client, "HTTP_RETRY_BACKOFF_SECONDS", 0)
+    return upstream
+
+def test_retries_until_success(upstream):
+    upstream.script([httpx.Response(503), httpx.Response(502), httpx.Response(200, json={"ok": True})])
+    breaker = CircuitBreaker("test")
+
+    response = asyncio.run(request_with_retries("GET", URL, breaker, max_retries=2))
+
+    assert response.status_code == 200
+    assert len(upstream.requests) == 3
+    assert breaker.state == "closed"
+
+def test_transport_errors_are_retried_then_raised(upstream):
+    upstream.script([httpx.ConnectError("refused")])
+    breaker = CircuitBreaker("test")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(request_with_retries("GET", URL, breaker, max_retries=2))
+    assert len(upstream.requests) == 3
+    assert breaker.consecutive_failures == 1
+
+def test_breaker_opens_and_short_circuits(upstream):
+    upstream.script([httpx.Response(503)])
+    breaker = CircuitBreaker("test", failure_threshold=2)
+
+    for _ in range(2):
+        asyncio.run(request_with_retries("GET", URL, breaker, max_retries=0))
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(request_with_retries("GET", URL, breaker))
+    assert len(upstream.requests) == 2
+
+def test_cancelled_half_open_probe_releases_the_breaker(monkeypatch):
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(hang)))
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    async def probe_and_cancel():
+        task = asyncio.create_task(request_with_retries("GET", URL, breaker))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(probe_and_cancel())
+    assert breaker.state == "open"
+    assert breaker.allow_request()
+
+@pytest.mark.parametrize("status,expected", [(503, 503), (502, 502), (504, 502), (401, 401), (404, 401)])
+def test_emergent_session_status_mapping(upstream, monkeypatch, status, expected):
+    monkeypatch.setattr(auth, "emergent_auth_breaker", CircuitBreaker("emergent_auth"))
+    upstream.script([httpx.Response(status)])
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(auth.get_user_from_emergent_session("session"))
+    assert exc.value.status_code == expected
+
+def test_emergent_session_invalid_json(upstream, monkeypatch):
+    monkeypatch.setattr(auth, "emergent_auth_breaker", CircuitBreaker("emergent_auth"))
+    upstream.script([httpx.Response(200, content=b"<html>")])
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(auth.get_user_from_emergent_session("session"))
+    assert exc.value.status_code == 500
+
+def test_emergent_session_success(upstream, monkeypatch):
+    monkeypatch.setattr(auth, "emergent_auth_breaker", CircuitBreaker("emergent_auth"))
+    upstream.script([httpx.Response(200, json={"email": "a@example.com"})])
+
+    assert asyncio.run(auth.get_user_from_emergent_session("session")) == {"email": "a@example.com"}
+    assert upstream.requests[0].headers["X-Session-ID"] == "session"
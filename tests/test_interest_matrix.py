@@ -0,0 +1,36 @@
+"""
+Interest matrix reloads keep profile changes that arrive while the users collection is being read
+"""
+import asyncio
+
+import interest_matrix as interest_matrix_module
+from interest_matrix import InterestMatrix
+
+def test_changes_during_a_reload_survive_the_swap(monkeypatch, pausing_db):
+    matrix = InterestMatrix()
+    users = [
+        {"id": "u1", "interests": ["chess"]},
+        {"id": "u2", "interests": ["chess", "go"]},
+        {"id": "u3", "interests": ["go"]},
+    ]
+
+    db = pausing_db(users)
+    monkeypatch.setattr(interest_matrix_module, "db", db)
+
+    async def scenario():
+        reload = asyncio.create_task(matrix.load())
+        await db.users.paused.wait()
+        # u1 was already read with its old interests; u4 signs up mid-load; u3 is removed
+        matrix.upsert("u1", ["go", "poker"])
+        matrix.upsert("u4", ["poker"])
+        matrix.remove("u3")
+        db.users.resume.set()
+        await reload
+
+    asyncio.run(scenario())
+
+    assert matrix.interests_of("u1") == {"go", "poker"}
+    assert matrix.interests_of("u3") == set()
+    assert matrix.top_matches(["poker"], exclude=[], k=5) == [("u1", 1), ("u4", 1)]
+    assert matrix.top_matches(["chess"], exclude=[], k=5) == [("u2", 1)]
+    assert matrix._pending is None
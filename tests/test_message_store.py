@@ -0,0 +1,140 @@
+"""
+Bucketed message store: appends only hit the open bucket, and pages stay complete
+when bucket time ranges overlap
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import message_store
+from message_store import append_messages, get_messages_page, new_bucket
+
+START = datetime(2026, 1, 1)
+
+class Result:
+    def __init__(self, matched_count=0):
+        self.matched_count = matched_count
+
+class Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, field, direction):
+        self._docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if value is None:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+class FakeMessages:
+    """Just enough of the messages collection, including the one-open-bucket unique index"""
+
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query, projection=None):
+        return Cursor([d for d in self.docs if _matches(d, query)])
+
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if _matches(doc, query):
+                for field in update.get("$unset", {}):
+                    doc.pop(field, None)
+                for field, spec in update.get("$push", {}).items():
+                    doc[field].extend(spec["$each"])
+                for field, amount in update.get("$inc", {}).items():
+                    doc[field] += amount
+                for field, value in update.get("$min", {}).items():
+                    doc[field] = min(doc[field], value)
+                for field, value in update.get("$max", {}).items():
+                    doc[field] = max(doc[field], value)
+                return Result(1)
+        return Result(0)
+
+    async def insert_one(self, doc):
+        if doc.get("open") and any(d["conversation_id"] == doc["conversation_id"] and d.get("open") for d in self.docs):
+            raise DuplicateKeyError("conversation_id_open_unique")
+        self.docs.append(doc)
+
+class FakeDb:
+    def __init__(self):
+        self.messages = FakeMessages()
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(message_store, "db", fake)
+    return fake
+
+def message(i: int) -> dict:
+    return {"message_id": f"m{i:04d}", "timestamp": START + timedelta(seconds=i), "text": str(i)}
+
+def test_appends_only_fill_the_open_bucket(db, monkeypatch):
+    monkeypatch.setattr(message_store, "MESSAGE_BUCKET_SIZE", 10)
+    # A sealed bucket with room, e.g. the last partial bucket of a migration
+    db.messages.docs.append(new_bucket("c1", [message(0)], migrated=True))
+
+    for i in range(1, 26):
+        asyncio.run(append_messages("c1", [message(i)]))
+
+    live = [d for d in db.messages.docs if not d.get("migrated")]
+    assert [d["count"] for d in live] == [10, 10, 5]
+    assert [d.get("open", False) for d in live] == [False, False, True]
+    assert db.messages.docs[0]["count"] == 1
+
+def test_latest_page_is_complete_with_interleaved_buckets(db):
+    # Two buckets whose time ranges overlap: A holds even messages, B odd ones
+    db.messages.docs.append(new_bucket("c1", [message(i) for i in range(0, 200, 2)]))
+    db.messages.docs.append(new_bucket("c1", [message(i) for i in range(1, 200, 2)]))
+
+    page, has_more = asyncio.run(get_messages_page("c1", limit=50))
+
+    assert [m["message_id"] for m in page] == [f"m{i:04d}" for i in range(150, 200)]
+    assert has_more
+
+def test_paging_back_and_forward_through_interleaved_buckets(db):
+    db.messages.docs.append(new_bucket("c1", [message(i) for i in range(0, 120, 2)]))
+    db.messages.docs.append(new_bucket("c1", [message(i) for i in range(1, 120, 2)]))
+    db.messages.docs.append(new_bucket("c1", [message(i) for i in range(120, 150)]))
+
+    before = (message(100)["timestamp"], message(100)["message_id"])
+    page, has_more = asyncio.run(get_messages_page("c1", before=before, limit=30))
+    assert [m["message_id"] for m in page] == [f"m{i:04d}" for i in range(70, 100)]
+    assert has_more
+
+    after = (message(20)["timestamp"], message(20)["message_id"])
+    page, has_more = asyncio.run(get_messages_page("c1", after=after, limit=30))
+    assert [m["message_id"] for m in page] == [f"m{i:04d}" for i in range(21, 51)]
+    assert has_more
@@ -0,0 +1,60 @@
+"""
+Mark-read only scans message buckets written since the reader's previous watermark
+"""
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import messaging
+from auth import get_current_user
+
+class FakeConversations:
+    def __init__(self, conversation):
+        self.conversation = conversation
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        return dict(self.conversation)
+
+class FakeMessages:
+    def __init__(self):
+        self.queries = []
+
+    async def update_many(self, query, update, array_filters=None):
+        self.queries.append(query)
+
+class FakeDb:
+    def __init__(self, conversation):
+        self.conversations = FakeConversations(conversation)
+        self.messages = FakeMessages()
+
+def mark_read(monkeypatch, conversation):
+    db = FakeDb(conversation)
+    monkeypatch.setattr(messaging, "db", db)
+
+    async def publish(user_ids, event_type, data):
+        pass
+
+    monkeypatch.setattr(messaging, "publish_to_users", publish)
+    app = FastAPI()
+    app.include_router(messaging.messaging_router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "u1"}
+
+    response = TestClient(app).post("/messaging/conversations/c1/read")
+    assert response.status_code == 200
+    return db.messages.queries[0]
+
+def test_scans_only_buckets_since_the_previous_watermark(monkeypatch):
+    previous = datetime(2026, 1, 1, 12, 0, 0)
+    query = mark_read(monkeypatch, {
+        "id": "c1", "user_id": "u1", "with_user_id": "u2",
+        "read_state": {"u1": {"last_read_at": previous, "last_read_message_id": "m1"}}
+    })
+
+    assert query["conversation_id"] == "c1"
+    assert query["last_at"] == {"$gt": previous - messaging.MARK_READ_SLACK}
+
+def test_first_mark_read_scans_every_bucket(monkeypatch):
+    query = mark_read(monkeypatch, {"id": "c1", "user_id": "u2", "with_user_id": "u1"})
+
+    assert "last_at" not in query
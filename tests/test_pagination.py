@@ -0,0 +1,79 @@
+"""
+Keyset pagination: filters, page slicing and cursors shared by the list endpoints
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, keyset_filter, keyset_page
+
+class Cursor:
+    """Records the sort and limit; filtering is checked separately through the query"""
+
+    def __init__(self, docs):
+        self._docs = docs
+        self.sort_spec = None
+        self.limit_n = None
+
+    def sort(self, spec):
+        self.sort_spec = spec
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    async def to_list(self, n):
+        return self._docs[:n]
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+        self.cursor = None
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        self.cursor = Cursor(self.docs)
+        return self.cursor
+
+def test_cursor_round_trip_and_bad_cursor():
+    now = datetime(2024, 5, 1, 12, 0, 0, 123000)
+    assert decode_cursor(encode_cursor(now, "r1")) == (now, "r1")
+    assert decode_cursor(None) is None
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+def test_keyset_filter():
+    now = datetime.utcnow()
+    assert keyset_filter("created_at", None) == {}
+    assert keyset_filter("joined_at", (now, "u1"), id_field="user_id") == {"$or": [
+        {"joined_at": {"$lt": now}},
+        {"joined_at": now, "user_id": {"$lt": "u1"}}
+    ]}
+
+def test_keyset_page_returns_cursor_only_when_more_remain():
+    now = datetime.utcnow()
+    docs = [{"id": f"r{i}", "created_at": now - timedelta(minutes=i)} for i in range(3)]
+
+    collection = FakeCollection(docs)
+    page, next_cursor = asyncio.run(keyset_page(collection, {"user_id": "u1"}, {"_id": 0}, None, 2, "created_at"))
+    assert [d["id"] for d in page] == ["r0", "r1"]
+    assert decode_cursor(next_cursor) == (docs[1]["created_at"], "r1")
+    assert collection.queries == [{"user_id": "u1"}]
+    assert collection.cursor.sort_spec == [("created_at", -1), ("id", -1)]
+    assert collection.cursor.limit_n == 3
+
+    page, next_cursor = asyncio.run(keyset_page(FakeCollection(docs), {}, {"_id": 0}, None, 3, "created_at"))
+    assert len(page) == 3
+    assert next_cursor is None
+
+def test_keyset_page_keeps_an_existing_or_in_the_query():
+    now = datetime.utcnow()
+    collection = FakeCollection([])
+    query = {"$or": [{"a": 1}, {"b": 1}]}
+    asyncio.run(keyset_page(collection, query, {"_id": 0}, (now, "r1"), 10, "created_at"))
+    assert collection.queries == [{"$and": [query, keyset_filter("created_at", (now, "r1"))]}]
@@ -0,0 +1,59 @@
+"""
+Password hash pool: in-flight counts follow the bcrypt threads, and failures are not counted as completed
+"""
+import asyncio
+import threading
+
+import pytest
+
+from auth import PasswordHashPool
+
+async def wait_until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+def test_cancelled_request_stays_in_flight_until_its_thread_finishes():
+    pool = PasswordHashPool(max_workers=1, max_pending=4)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return "hash"
+
+    async def scenario():
+        request = asyncio.create_task(pool.run(slow_hash))
+        await wait_until(started.is_set)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # The thread is still hashing, so it still holds a pool slot
+        assert pool.stats()["in_flight"] == 1
+        release.set()
+        await wait_until(lambda: pool.pending == 0)
+
+    asyncio.run(scenario())
+    pool.shutdown()
+
+    assert pool.stats()["completed"] == 1
+    assert pool.stats()["failed"] == 0
+
+def test_failures_are_counted_separately():
+    pool = PasswordHashPool(max_workers=1, max_pending=4)
+
+    def broken_hash():
+        raise ValueError("bad salt")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await pool.run(broken_hash)
+        await wait_until(lambda: pool.pending == 0)
+
+    asyncio.run(scenario())
+    pool.shutdown()
+
+    assert pool.stats()["failed"] == 1
+    assert pool.stats()["completed"] == 0
@@ -0,0 +1,74 @@
+"""
+Presence endpoints: status lookups need a session and never reveal users across a block
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import presence
+from auth import get_current_user
+from blocklist import BlockList
+
+class Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, n):
+        return self._docs[:n]
+
+class FakeUsers:
+    def __init__(self, users):
+        self.users = users
+
+    def find(self, query, projection=None):
+        return Cursor([dict(u) for u in self.users if u["id"] in query["id"]["$in"]])
+
+    async def find_one(self, query, projection=None):
+        return next((dict(u) for u in self.users if u["id"] == query["id"]), None)
+
+class FakeDb:
+    def __init__(self, users):
+        self.users = FakeUsers(users)
+
+@pytest.fixture
+def client(monkeypatch):
+    now = datetime.utcnow()
+    monkeypatch.setattr(presence, "db", FakeDb([{"id": u, "last_active": now} for u in ("u2", "u3", "u4")]))
+    block_list = BlockList()
+    block_list.apply("u1", "u3", True)  # u1 blocked u3
+    block_list.apply("u4", "u1", True)  # u4 blocked u1
+    monkeypatch.setattr(presence, "block_list", block_list)
+
+    app = FastAPI()
+    app.include_router(presence.presence_router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "u1"}
+    return TestClient(app)
+
+def test_batch_omits_users_on_either_side_of_a_block(client):
+    response = client.post("/presence/status/batch", json={"user_ids": ["u2", "u3", "u4"]})
+
+    assert response.status_code == 200
+    assert list(response.json()["statuses"]) == ["u2"]
+
+def test_single_status_hides_blocked_users(client):
+    assert client.get("/presence/status/u2").status_code == 200
+    assert client.get("/presence/status/u3").status_code == 404
+    assert client.get("/presence/status/u4").status_code == 404
+
+def test_status_requires_a_session():
+    app = FastAPI()
+    app.include_router(presence.presence_router)
+    client = TestClient(app)
+
+    assert client.post("/presence/status/batch", json={"user_ids": ["u2"]}).status_code == 401
+    assert client.get("/presence/status/u2").status_code == 401
+
+def test_block_list_drives_presence_visibility(monkeypatch):
+    block_list = BlockList()
+    block_list.apply("u4", "u1", True)
+    monkeypatch.setattr(presence, "block_list", block_list)
+
+    assert not presence.presence_visible_across_blocks("u1", "u4")
+    assert presence.presence_visible_across_blocks("u1", "u2")
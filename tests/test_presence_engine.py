@@ -0,0 +1,45 @@
+"""
+Presence flushes against a real mongod (TEST_MONGO_URL, default localhost): workers
+flushing out of order never move last_active or is_online backwards
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from presence_engine import PresenceEngine
+
+def test_older_heartbeat_flushed_later_does_not_win(mongo_url):
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    t1 = t0 + timedelta(seconds=5)
+
+    async def scenario():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f"xelaconnect_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            await db.users.insert_one({"id": "u1"})
+            a, b = PresenceEngine(db), PresenceEngine(db)
+            # Worker A saw the socket close at t1; worker B still holds an online heartbeat from t0
+            a._state["u1"] = {"last_active": t1, "is_online": False}
+            b._state["u1"] = {"last_active": t0, "is_online": True}
+            a._dirty.add("u1")
+            b._dirty.add("u1")
+
+            await a.flush()
+            await b.flush()
+            stale = await db.users.find_one({"id": "u1"})
+
+            b._state["u1"] = {"last_active": t1 + timedelta(seconds=5), "is_online": True}
+            b._dirty.add("u1")
+            await b.flush()
+            fresh = await db.users.find_one({"id": "u1"})
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+        return stale, fresh
+
+    stale, fresh = asyncio.run(scenario())
+
+    assert (stale["last_active"], stale["is_online"]) == (t1, False)
+    assert (fresh["last_active"], fresh["is_online"]) == (t1 + timedelta(seconds=5), True)
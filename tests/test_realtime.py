@@ -0,0 +1,122 @@
+"""
+WebSocket authentication and per-worker socket bookkeeping
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import realtime
+
+USER = {"id": "u1", "name": "Test"}
+
+@pytest.fixture
+def client(monkeypatch):
+    async def resolve(token, required=True):
+        return dict(USER) if token == "good" else None
+
+    changes = []
+
+    async def record_change(user_id, is_online):
+        changes.append((user_id, is_online))
+
+    monkeypatch.setattr(realtime, "resolve_session_user", resolve)
+    monkeypatch.setattr(realtime, "_connection_handlers", [record_change])
+    monkeypatch.setattr(realtime, "WS_AUTH_TIMEOUT_SECONDS", 0.5)
+
+    app = FastAPI()
+    app.include_router(realtime.realtime_router, prefix="/api")
+    test_client = TestClient(app)
+    test_client.changes = changes
+    return test_client
+
+def test_first_frame_auth(client):
+    with client.websocket_connect("/api/ws") as ws:
+        ws.send_json({"type": "auth", "token": "good"})
+        assert ws.receive_json() == {"type": "ready"}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+    assert client.changes == [("u1", True), ("u1", False)]
+
+def test_bearer_header_auth(client):
+    with client.websocket_connect("/api/ws", headers={"Authorization": "Bearer good"}) as ws:
+        assert ws.receive_json() == {"type": "ready"}
+
+@pytest.mark.parametrize("frame", [{"type": "auth", "token": "bad"}, {"type": "ping"}, ["auth"]])
+def test_rejects_anything_but_a_valid_auth_frame(client, frame):
+    with client.websocket_connect("/api/ws") as ws:
+        ws.send_json(frame)
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
+    assert client.changes == []
+
+def test_query_string_token_is_ignored(client):
+    with client.websocket_connect("/api/ws?token=good") as ws:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
+
+def test_user_stays_online_while_another_worker_holds_a_socket(client, monkeypatch):
+    async def unregister(user_id):
+        return False  # another worker still has a live registration
+
+    async def register(user_id):
+        pass
+
+    monkeypatch.setattr(realtime.socket_registry, "unregister", unregister)
+    monkeypatch.setattr(realtime.socket_registry, "register", register)
+
+    with client.websocket_connect("/api/ws", headers={"Authorization": "Bearer good"}) as ws:
+        ws.receive_json()
+    assert client.changes == [("u1", True)]
+
+class FakeSocket:
+    def __init__(self, stalled: bool = False):
+        self.sent = []
+        self.stalled = stalled
+        self.close_code = None
+
+    async def send_json(self, payload):
+        if self.stalled:
+            await asyncio.sleep(60)
+        self.sent.append(payload)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+def test_presence_subscriptions_skip_hidden_users(monkeypatch):
+    hidden = {("u1", "u3")}
+    monkeypatch.setattr(realtime, "_presence_visibility_checks", [lambda viewer, user: (viewer, user) not in hidden])
+    manager = realtime.ConnectionManager()
+    websocket = FakeSocket()
+    manager.connect("u1", websocket)
+
+    manager.subscribe_presence(websocket, ["u2", "u3"])
+    assert manager.stats()["presence_subscriptions"] == 1
+    assert asyncio.run(manager.send_to_presence_subscribers("u2", {"type": "presence"})) == 1
+
+    # A block made after subscribing stops the pushes too
+    hidden.add(("u1", "u2"))
+    assert asyncio.run(manager.send_to_presence_subscribers("u2", {"type": "presence"})) == 0
+    assert len(websocket.sent) == 1
+
+def test_stalled_socket_is_dropped_without_holding_up_the_rest(monkeypatch):
+    monkeypatch.setattr(realtime, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+    manager = realtime.ConnectionManager()
+    stalled, healthy = FakeSocket(stalled=True), FakeSocket()
+    manager.connect("u1", stalled)
+    manager.connect("u1", healthy)
+
+    async def scenario():
+        first = await manager.send_to_user("u1", {"n": 1})
+        await asyncio.sleep(0.01)  # let the close task run
+        second = await manager.send_to_user("u1", {"n": 2})
+        return first, second
+
+    assert asyncio.run(scenario()) == (1, 1)
+    assert healthy.sent == [{"n": 1}, {"n": 2}]
+    assert stalled.close_code == 1013
+    assert manager.stats()["slow_sockets_dropped"] == 1
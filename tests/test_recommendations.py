@@ -0,0 +1,85 @@
+"""
+Recommendation snapshots against a real mongod (TEST_MONGO_URL, default localhost):
+invalidations win over snapshots computed before them, and one worker holds the job lease
+"""
+import asyncio
+import uuid
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import recommendations
+from indexes import INDEXES
+from recommendations import JobLease, RecommendationRefresher, get_recommendations, invalidate_recommendations
+
+def run_with_db(mongo_url, monkeypatch, scenario):
+    """Run scenario(db) against a fresh database with the recommendations indexes"""
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f"xelaconnect_test_{uuid.uuid4().hex[:8]}"]
+        monkeypatch.setattr(recommendations, "db", db)
+        for index in INDEXES["recommendations"]:
+            await db.recommendations.create_index(index["keys"], name=index["name"], unique=index.get("unique", False))
+        try:
+            await scenario(db)
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+    asyncio.run(main())
+
+def snapshot(user_id: str, match_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "items": [{"user_id": match_id, "shared": 1, "common_interests": ["chess"]}],
+        "computed_at": datetime.utcnow()
+    }
+
+def test_invalidation_during_a_refresh_is_not_overwritten(mongo_url, monkeypatch):
+    async def compute(user_id, interests):
+        if user_id == "u1":
+            # u1 sends u9 a connection request while its snapshot is being computed
+            await invalidate_recommendations("u1", "u9")
+        return snapshot(user_id, "u9")
+
+    monkeypatch.setattr(recommendations, "compute_recommendations", compute)
+
+    async def scenario(db):
+        refresher = RecommendationRefresher()
+        await refresher._refresh_batch([{"id": "u1"}, {"id": "u2"}])
+
+        assert refresher.snapshots_written == 1
+        assert refresher.stale_snapshots == 1
+        stale = await db.recommendations.find_one({"user_id": "u1"})
+        assert "items" not in stale and stale["version"] == 1
+        assert (await db.recommendations.find_one({"user_id": "u2"}))["items"][0]["user_id"] == "u9"
+
+        # The next discover request recomputes and stores a snapshot at the new version
+        async def recompute(user_id, interests):
+            return snapshot(user_id, "u3")
+
+        monkeypatch.setattr(recommendations, "compute_recommendations", recompute)
+        served = await get_recommendations({"id": "u1"})
+        assert served["items"][0]["user_id"] == "u3"
+        stored = await db.recommendations.find_one({"user_id": "u1"})
+        assert stored["items"][0]["user_id"] == "u3" and stored["version"] == 1
+
+    run_with_db(mongo_url, monkeypatch, scenario)
+
+def test_one_worker_holds_the_job_lease(mongo_url, monkeypatch):
+    async def scenario(db):
+        a, b = JobLease("job", 60), JobLease("job", 60)
+
+        assert await a.acquire()
+        assert not await b.acquire()
+        assert await a.acquire()  # renewal
+
+        await a.release()
+        assert await b.acquire()
+        assert not await a.acquire()
+
+        # A holder that stops renewing loses the lease once it lapses
+        expired = JobLease("other", -1)
+        assert await expired.acquire()
+        assert await JobLease("other", 60).acquire()
+
+    run_with_db(mongo_url, monkeypatch, scenario)
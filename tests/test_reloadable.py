@@ -0,0 +1,44 @@
+"""
+Reloadable mirrors: a failed refresh keeps the live state and the loop keeps running
+"""
+import asyncio
+
+from reloadable import ReloadableMirror
+
+class Counter(ReloadableMirror):
+    name = "Counter"
+
+    def __init__(self, results):
+        super().__init__(refresh_seconds=0)
+        self._results = list(results)
+        self.value = None
+        self.builds = 0
+
+    async def _build(self):
+        self.builds += 1
+        result = self._results.pop(0) if self._results else self.value
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _replay(self, state, change):
+        pass
+
+    def _swap(self, state):
+        self.value = state
+
+def test_refresh_failure_keeps_state_and_loop_running():
+    mirror = Counter([1, RuntimeError("mongo down"), 2])
+
+    async def scenario():
+        await mirror.start()
+        assert mirror.value == 1 and mirror.loaded
+        while mirror.builds < 3:
+            await asyncio.sleep(0)
+        await mirror.stop()
+
+    asyncio.run(scenario())
+
+    assert mirror.value == 2
+    assert mirror._task is None
+    assert mirror._pending is None
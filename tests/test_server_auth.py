@@ -0,0 +1,70 @@
+"""
+Auth routes on the full app; needs every backend requirement, including emergentintegrations
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("emergentintegrations")
+
+from fastapi.testclient import TestClient
+
+import auth
+import server
+from auth import session_cache
+
+class FakeSessions:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_one(self, query):
+        self.deleted.append(query["session_token"])
+
+class FakeDb:
+    def __init__(self):
+        self.user_sessions = FakeSessions()
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(auth, "db", fake)
+    return fake
+
+@pytest.fixture
+def client():
+    # No context manager: startup hooks (indexes, background jobs) need a database
+    return TestClient(server.app)
+
+def cache_session(token: str, user_id: str = "u1"):
+    session = {"user_id": user_id, "expires_at": datetime.utcnow() + timedelta(days=1)}
+    session_cache.set(token, session, {"id": user_id}, session_cache.generation())
+
+def test_logout_deletes_the_session_and_drops_it_from_the_cache(client, db):
+    cache_session("abc")
+    assert session_cache.get("abc") == {"id": "u1"}
+
+    response = client.post("/api/auth/logout", headers={"Authorization": "Bearer abc"})
+
+    assert response.status_code == 200
+    assert db.user_sessions.deleted == ["abc"]
+    assert session_cache.get("abc") is None
+
+def test_logout_without_a_token_is_a_no_op(client, db):
+    response = client.post("/api/auth/logout")
+
+    assert response.status_code == 200
+    assert db.user_sessions.deleted == []
+
+def test_metrics_need_the_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/api/metrics").status_code == 403
+    assert client.get("/api/metrics", headers={"X-Metrics-Token": "wrong"}).status_code == 403
+    response = client.get("/api/metrics", headers={"X-Metrics-Token": "s3cret"})
+    assert response.status_code == 200
+    assert "session_cache" in response.json()
+
+def test_metrics_are_off_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "")
+
+    assert client.get("/api/metrics", headers={"X-Metrics-Token": ""}).status_code == 404
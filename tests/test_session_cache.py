@@ -0,0 +1,48 @@
+"""
+Session cache: a user document read before an invalidation is never cached
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import auth
+from auth import SessionCache, resolve_session_user
+
+def session_row(user: dict) -> dict:
+    return {"user_id": user["id"], "expires_at": datetime.utcnow() + timedelta(days=1), "user": user}
+
+def test_invalidation_during_a_fetch_is_not_lost(monkeypatch):
+    cache = SessionCache(100, 60)
+    monkeypatch.setattr(auth, "session_cache", cache)
+    current = {"id": "u1", "name": "Old"}
+
+    async def fetch(session_token):
+        row = session_row(dict(current))
+        # update_profile writes and invalidates while this read is in flight
+        current["name"] = "New"
+        await auth.invalidate_user("u1")
+        return row
+
+    monkeypatch.setattr(auth, "_fetch_session_user", fetch)
+
+    async def refetch(session_token):
+        return session_row(dict(current))
+
+    async def scenario():
+        first = await resolve_session_user("abc")
+        monkeypatch.setattr(auth, "_fetch_session_user", refetch)
+        second = await resolve_session_user("abc")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first["name"] == "Old"
+    assert second["name"] == "New"
+    assert cache.stale_sets == 1
+
+def test_lookups_without_invalidations_are_cached():
+    cache = SessionCache(100, 60)
+    user = {"id": "u1"}
+    cache.set("abc", session_row(user), user, cache.generation())
+
+    assert cache.get("abc") == user
+    assert cache.stats()["hits"] == 1
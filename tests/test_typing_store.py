@@ -0,0 +1,45 @@
+"""
+Typing indicators: repeats are throttled to keep bus writes bounded, state changes always go out
+"""
+import pytest
+
+import typing_store as typing_store_module
+from typing_store import TypingStore
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(typing_store_module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_repeats_are_published_at_most_twice_per_ttl(clock):
+    store = TypingStore(ttl=4)
+    published = 0
+    # A keystroke every 0.25s for 8s, each delivered back into the store like a bus event
+    for _ in range(32):
+        if store.should_publish("u1", "u2", True):
+            published += 1
+            store.set("u1", "u2", True)
+        clock[0] += 0.25
+
+    assert published == 4
+    assert store.is_typing("u1", "u2")
+    assert store.stats()["throttled"] == 28
+
+def test_state_changes_are_always_published(clock):
+    store = TypingStore(ttl=4)
+    assert store.should_publish("u1", "u2", True)
+    store.set("u1", "u2", True)
+
+    assert store.should_publish("u1", "u2", False)
+    store.set("u1", "u2", False)
+    # Already stopped: nothing changes for the recipient
+    assert not store.should_publish("u1", "u2", False)
+    assert store.should_publish("u1", "u2", True)
+
+def test_stop_after_expiry_is_dropped(clock):
+    store = TypingStore(ttl=4)
+    store.set("u1", "u2", True)
+    clock[0] += 5
+
+    assert not store.should_publish("u1", "u2", False)